@@ -0,0 +1,225 @@
+####################################################
+###             VOLATILITY ANALYTICS             ###
+####################################################
+
+# The figures quoted on the store value slides (largest daily swings, rolling
+# volatility, drawdowns), computed from the market store instead of typed in
+# by hand. Every coin is processed in the same vectorized pass over the
+# coin-partitioned columns (see markets.py), and the running state is kept so
+# that rows appended later are folded in without going over the history again.
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Trailing windows, in days, of the rolling volatility
+WINDOWS = (7, 30, 90)
+
+
+def _day(epoch):
+    return str(np.datetime64(int(epoch), 's').astype('datetime64[D]'))
+
+
+def _first_extreme(values, starts, lengths, largest=True):
+    """Per segment maximum (or minimum) of values, ignoring NaNs, and the
+    position where it first occurs. Segments with no values give NaN and -1."""
+    fill = -np.inf if largest else np.inf
+    v = np.where(np.isnan(values), fill, values)
+    ext = (np.maximum if largest else np.minimum).reduceat(v, starts)
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    hit = np.flatnonzero(v == ext[seg])
+    pos = np.full(len(starts), -1, dtype=np.int64)
+    segs, first = np.unique(seg[hit], return_index=True)
+    pos[segs] = hit[first]
+    empty = np.isinf(ext)
+    ext[empty] = np.nan
+    pos[empty] = -1
+    return ext, pos
+
+
+def _segment_cummax(values, seg):
+    """Running maximum of values restarting at every segment, for finite values.
+
+    Each segment is shifted above the previous one so that a single
+    np.maximum.accumulate over the whole array never carries across segments.
+    """
+    span = values.max() - values.min() + 1.0
+    shift = seg * span
+    return np.maximum.accumulate(values + shift) - shift
+
+
+class VolatilityStats(object):
+    """Running volatility figures per coin, plus the daily change of the
+    combined market cap of all coins."""
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(windows)
+        self.coins = OrderedDict()
+        # date (epoch seconds) -> [closing cap, opening cap] summed over coins
+        self.market = {}
+
+    def _extends(self, store):
+        # True when every row seen so far is still where it was in store
+        dates = store.columns['date']
+        for name, state in self.coins.items():
+            if state['seen'] == 0:
+                continue
+            if name not in store.offsets:
+                return False
+            lo, hi = store.offsets[name]
+            if hi - lo < state['seen'] or int(dates[lo + state['seen'] - 1]) != state['last']:
+                return False
+        return True
+
+    def _state(self, name):
+        if name not in self.coins:
+            state = {'seen': 0, 'last': None, 'peak': -np.inf,
+                     'max_up': (np.nan, None), 'max_down': (np.nan, None),
+                     'max_drawdown': (np.nan, None), 'volatility': {}}
+            for w in self.windows:
+                state['volatility'][w] = {'latest': np.nan, 'max': (np.nan, None)}
+            self.coins[name] = state
+        return self.coins[name]
+
+    def update(self, store):
+        """Fold in every row of store not seen by a previous update."""
+        tail = max(self.windows) - 1
+        if not self._extends(store):
+            # History was rewritten rather than appended to: start over
+            self.__init__(self.windows)
+        names, chunks, fresh = [], [], []
+        for name in store.coins():
+            lo, hi = store.offsets[name]
+            seen = lo + self._state(name)['seen']
+            if hi <= seen:
+                continue
+            # Rolling windows need the rows just before the new ones too
+            start = max(lo, seen - tail)
+            names.append(name)
+            chunks.append(np.arange(start, hi))
+            fresh.append(np.arange(start, hi) >= seen)
+        if not names:
+            return self
+
+        idx = np.concatenate(chunks)
+        new = np.concatenate(fresh)
+        lengths = np.array([len(c) for c in chunks])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        seg = np.repeat(np.arange(len(names)), lengths)
+        cols = store.columns
+        dates = np.asarray(cols['date'])[idx]
+        change = np.asarray(cols['change%'], dtype=np.float64)[idx]
+        close = np.asarray(cols['close'], dtype=np.float64)[idx]
+        cap = np.asarray(cols['market'], dtype=np.float64)[idx]
+
+        # Largest daily swings
+        fresh_change = np.where(new, change, np.nan)
+        up, up_pos = _first_extreme(fresh_change, starts, lengths, largest=True)
+        down, down_pos = _first_extreme(fresh_change, starts, lengths, largest=False)
+
+        # Rolling standard deviation of the daily change, from running sums
+        x = np.nan_to_num(change)
+        ok = (~np.isnan(change)).astype(np.float64)
+        sx = np.concatenate([[0.], np.cumsum(x)])
+        sxx = np.concatenate([[0.], np.cumsum(x * x)])
+        sn = np.concatenate([[0.], np.cumsum(ok)])
+        rank = np.arange(len(idx)) - starts[seg]
+        rolling = {}
+        for w in self.windows:
+            end = np.arange(1, len(idx) + 1)
+            begin = np.maximum(end - w, 0)
+            n = sn[end] - sn[begin]
+            s = sx[end] - sx[begin]
+            ss = sxx[end] - sxx[begin]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = (ss - s * s / n) / (n - 1)
+            vol = np.sqrt(np.maximum(var, 0))
+            vol[(rank < w - 1) | (n < 2) | ~new] = np.nan
+            rolling[w] = vol
+
+        # Drawdown from the highest close so far (in log space for the shift)
+        valid = close > 0
+        logc = np.log(np.where(valid, close, 1.0))
+        logc[~valid] = logc[valid].min() if valid.any() else 0.0
+        peaks = np.array([self.coins[n]['peak'] for n in names])
+        peak = np.maximum(_segment_cummax(logc, seg), peaks[seg])
+        drawdown = np.where(valid & new, 1.0 - np.exp(logc - peak), np.nan)
+        dd, dd_pos = _first_extreme(drawdown, starts, lengths, largest=True)
+        last = starts + lengths - 1
+
+        for i, name in enumerate(names):
+            state = self.coins[name]
+            state['seen'] = int(store.offsets[name][1] - store.offsets[name][0])
+            state['last'] = int(dates[last[i]])
+            state['peak'] = float(peak[last[i]])
+            if up_pos[i] >= 0 and not up[i] <= state['max_up'][0]:
+                state['max_up'] = (float(up[i]), int(dates[up_pos[i]]))
+            if down_pos[i] >= 0 and not down[i] >= state['max_down'][0]:
+                state['max_down'] = (float(down[i]), int(dates[down_pos[i]]))
+            if dd_pos[i] >= 0 and not dd[i] <= state['max_drawdown'][0]:
+                state['max_drawdown'] = (float(dd[i]), int(dates[dd_pos[i]]))
+        for w in self.windows:
+            top, top_pos = _first_extreme(rolling[w], starts, lengths, largest=True)
+            for i, name in enumerate(names):
+                state = self.coins[name]['volatility'][w]
+                state['latest'] = float(rolling[w][last[i]])
+                if top_pos[i] >= 0 and not top[i] <= state['max'][0]:
+                    state['max'] = (float(top[i]), int(dates[top_pos[i]]))
+
+        # Combined market cap; the opening cap is recovered from the change
+        days, inverse = np.unique(dates[new], return_inverse=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            opening = np.nan_to_num(cap[new] / (1.0 + change[new]))
+        closing_sum = np.bincount(inverse, weights=cap[new])
+        opening_sum = np.bincount(inverse, weights=opening)
+        for day, c, o in zip(days, closing_sum, opening_sum):
+            total = self.market.setdefault(int(day), [0.0, 0.0])
+            total[0] += c
+            total[1] += o
+        return self
+
+    def market_change(self):
+        """(dates, daily change) of the combined market cap, sorted by date."""
+        days = np.array(sorted(self.market), dtype=np.int64)
+        totals = np.array([self.market[d] for d in days]).reshape(-1, 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change = totals[:, 0] / totals[:, 1] - 1.0
+        change[~np.isfinite(change)] = np.nan
+        return days, change
+
+    def summary(self):
+        """Plain (JSON-ready) dict of the current figures, dates as YYYY-MM-DD."""
+        def point(pair):
+            value, date = pair
+            return {'value': value if date is not None else None,
+                    'date': _day(date) if date is not None else None}
+
+        coins = OrderedDict()
+        for name, state in self.coins.items():
+            coins[name] = {
+                'max_up': point(state['max_up']),
+                'max_down': point(state['max_down']),
+                'max_drawdown': point(state['max_drawdown']),
+                'volatility': OrderedDict(
+                    (str(w), {'latest': None if np.isnan(v['latest']) else v['latest'],
+                              'max': point(v['max'])})
+                    for w, v in state['volatility'].items()),
+            }
+        ranked = [n for n in coins if coins[n]['max_up']['date'] is not None]
+        days, change = self.market_change()
+        market = {'max_up': {'value': None, 'date': None},
+                  'max_down': {'value': None, 'date': None}}
+        if np.isfinite(change).any():
+            hi, lo = np.nanargmax(change), np.nanargmin(change)
+            market['max_up'] = {'value': float(change[hi]), 'date': _day(days[hi])}
+            market['max_down'] = {'value': float(change[lo]), 'date': _day(days[lo])}
+        return {
+            'coins': coins,
+            'market': market,
+            'top_up': max(ranked, key=lambda n: coins[n]['max_up']['value']) if ranked else None,
+            'top_down': min(ranked, key=lambda n: coins[n]['max_down']['value']) if ranked else None,
+        }
+
+
+def volatility_summary(store, windows=WINDOWS):
+    return VolatilityStats(windows).update(store).summary()
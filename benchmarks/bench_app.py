@@ -0,0 +1,341 @@
+####################################################
+###             APP BENCHMARK SUITE              ###
+####################################################
+
+# Baseline timings for the app's hot paths:
+#
+#   import     import time of crypto.py, per #### section (fresh interpreter)
+#   treemap    build_treemap + serialization, per granularity/dataset snapshot
+#   plots      build_plots + serialization over random date windows
+#   callbacks  every registered Dash callback through the Flask test client,
+#              with the figure cache off and then warm, plus response sizes
+#
+# Each benchmark reports min/mean/p50/p90/p99/max, and the whole run is
+# written as JSON so runs can be compared:
+#
+#     python benchmarks/bench_app.py                       # all, to results/
+#     python benchmarks/bench_app.py plots callbacks -n 50
+#     python benchmarks/bench_app.py --compare results/before.json
+#
+# Runs are reproducible for a given --seed and data bundle.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import date
+from collections import OrderedDict
+
+import numpy as np
+
+from sections import section_starts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# No background data polling or cache warm-up while measuring
+os.environ['DATA_RELOAD_INTERVAL'] = '0'
+os.environ['CACHE_WARMUP'] = '0'
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def summarize(samples, sizes=None):
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    summary = OrderedDict([
+        ('n', int(len(ms))),
+        ('min_ms', float(ms.min())),
+        ('mean_ms', float(ms.mean())),
+        ('p50_ms', float(np.percentile(ms, 50))),
+        ('p90_ms', float(np.percentile(ms, 90))),
+        ('p99_ms', float(np.percentile(ms, 99))),
+        ('max_ms', float(ms.max())),
+    ])
+    if sizes is not None:
+        summary['bytes_p50'] = int(np.percentile(sizes, 50))
+        summary['bytes_max'] = int(np.max(sizes))
+    return summary
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+################################
+##        Import time         ##
+################################
+
+def import_sections():
+    """Execute crypto.py section by section in this process and time each."""
+    path = os.path.join(ROOT, 'crypto.py')
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    chunks = section_starts(source)
+    namespace = {'__name__': 'crypto', '__file__': path}
+    sys.modules['crypto'] = type(sys)('crypto')
+    timings = OrderedDict()
+    for i, (start, name) in enumerate(chunks):
+        end = chunks[i + 1][0] if i + 1 < len(chunks) else len(source)
+        # Pad with newlines so tracebacks keep crypto.py's line numbers
+        code = compile('\n' * source.count('\n', 0, start) + source[start:end], path, 'exec')
+        seconds, _ = timed(exec, code, namespace)
+        timings[name] = timings.get(name, 0.0) + seconds
+    return timings
+
+
+def bench_import(args):
+    # Fresh interpreters, so nothing is already imported or cached in memory
+    samples = OrderedDict()
+    for _ in range(args.import_runs):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--import-sections'],
+                                      cwd=ROOT)
+        for name, seconds in json.loads(out.decode('utf-8').splitlines()[-1]).items():
+            samples.setdefault(name, []).append(seconds)
+    totals = [sum(run) for run in zip(*samples.values())]
+    results = OrderedDict((name, summarize(values)) for name, values in samples.items())
+    results['total'] = summarize(totals)
+    return results
+
+
+################################
+##      Figure builders       ##
+################################
+
+def bench_treemap(args, crypto):
+    snap = crypto.data.current
+    rng = random.Random(args.seed)
+    results = OrderedDict()
+    for (granularity, dataset), layouts in sorted(snap.treemaps.items()):
+        layouts.rects  # squarify once up front, as the app does on first use
+        positions = list(range(len(layouts)))
+        if args.n < len(positions):
+            positions = rng.sample(positions, args.n)
+        samples, sizes = [], []
+        for pos in positions:
+            seconds, body = timed(lambda: crypto.figcache.to_json_bytes(
+                crypto.build_treemap(layouts, pos, crypto.treemap_titles[dataset])))
+            samples.append(seconds)
+            sizes.append(len(body))
+        results['{}/{}'.format(granularity, dataset)] = summarize(samples, sizes)
+    return results
+
+
+def random_windows(snap, rng, n):
+    first = snap.min_date.date().toordinal()
+    last = snap.max_date.date().toordinal()
+    windows = []
+    for _ in range(n):
+        a, b = sorted(rng.randint(first, last) for _ in range(2))
+        windows.append((date.fromordinal(a), date.fromordinal(b)))
+    return windows
+
+
+def bench_plots(args, crypto):
+    snap = crypto.data.current
+    rng = random.Random(args.seed)
+    samples, sizes = [], []
+    for start, end in random_windows(snap, rng, args.n):
+        seconds, body = timed(lambda: crypto.figcache.to_json_bytes(
+            crypto.build_plots(snap, initial_date=start, end_date=end, zoom=True)))
+        samples.append(seconds)
+        sizes.append(len(body))
+    full_seconds = [timed(lambda: crypto.figcache.to_json_bytes(crypto.build_plots(snap)))[0]
+                    for _ in range(min(args.n, 10))]
+    return OrderedDict([('random windows', summarize(samples, sizes)),
+                        ('full range', summarize(full_seconds))])
+
+
+################################
+##         Callbacks          ##
+################################
+
+class NoCache(object):
+    """Stands in for the figure cache so every call builds its figure."""
+
+    def get_or_build(self, key, build):
+        import figcache
+        return figcache.to_json_bytes(build())
+
+
+def callback_inputs(crypto, rng, n):
+    """{callback id: [(inputs, state), ...]} of n realistic requests each."""
+    snap = crypto.data.current
+    month = snap.treemaps[('month', 'count')].index
+    week = snap.treemaps[('week', 'count')].index
+    coins = snap.storevalue_coins
+    windows = [(str(a), str(b)) for a, b in random_windows(snap, rng, n)]
+
+    def slider(i):
+        granularity = 'week' if i % 2 else 'month'
+        index = week if granularity == 'week' else month
+        value = rng.randint(index.first, index.last)
+        return [('date_slider', 'value', value), ('load_decentralized', 'value', 'load')], \
+               [('treemap_granularity', 'value', granularity)]
+
+    def storevalue(i):
+        picked = rng.sample(coins, rng.randint(1, len(coins)))
+        start, end = windows[i]
+        return [('load_storevalue', 'value', 'load'), ('storevalue_coins', 'value', picked),
+                ('storevalue_start', 'value', start), ('storevalue_end', 'value', end)], []
+
+    def correlation(i):
+        start, end = windows[i]
+        return [('load_storevalue', 'value', 'load'), ('correlation_start', 'value', start),
+                ('correlation_end', 'value', end)], []
+
+    def fastcheap(i):
+        start, end = windows[i]
+        return [('fastandcheap', 'relayoutData', {'xaxis.range[0]': start, 'xaxis.range[1]': end})], []
+
+    def granularity(i):
+        return [('treemap_granularity', 'value', 'week' if i % 2 else 'month')], \
+               [('date_slider', 'value', rng.randint(month.first, month.last))]
+
+    makers = {'vpm_treemap.figure': slider,
+              'cpm_treemap.figure': slider,
+              'change.figure': storevalue,
+              'correlation.figure': correlation,
+              'fastandcheap.figure': fastcheap,
+              'date_slider_container.children': granularity}
+    return OrderedDict((cid, [makers[cid](i) for i in range(n)])
+                       for cid in crypto.app.callback_map if cid in makers)
+
+
+def request_body(callback_id, inputs, state):
+    output_id, output_prop = callback_id.rsplit('.', 1)
+    return json.dumps({
+        'output': {'id': output_id, 'property': output_prop},
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+    })
+
+
+def bench_callbacks(args, crypto):
+    client = crypto.server.test_client()
+    rng = random.Random(args.seed)
+    requests = callback_inputs(crypto, rng, args.n)
+    skipped = [cid for cid in crypto.app.callback_map if cid not in requests]
+
+    results = OrderedDict()
+    real_cache = crypto.figure_cache
+    for mode, cache in (('uncached', NoCache()),
+                        ('cached', crypto.figcache.TwoTierCache(crypto.figcache.LRUCache(maxsize=100000)))):
+        crypto.figure_cache = cache
+        try:
+            rounds = 1 if mode == 'uncached' else 2
+            for cid, calls in requests.items():
+                samples, sizes, statuses = [], [], {}
+                for round_ in range(rounds):
+                    for inputs, state in calls:
+                        seconds, response = timed(lambda: client.post(
+                            '/_dash-update-component', data=request_body(cid, inputs, state),
+                            content_type='application/json'))
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                        # The cached pass fills the cache first, then measures hits
+                        if mode == 'uncached' or round_ == 1:
+                            samples.append(seconds)
+                            sizes.append(len(response.data))
+                summary = summarize(samples, sizes)
+                summary['status'] = dict((str(k), v) for k, v in statuses.items())
+                results['{} ({})'.format(cid, mode)] = summary
+        finally:
+            crypto.figure_cache = real_cache
+    if skipped:
+        results['skipped'] = skipped
+    return results
+
+
+################################
+##          Reporting         ##
+################################
+
+def git_revision():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.DEVNULL)
+        return out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(title, results, baseline=None):
+    print('\n' + title)
+    for name, summary in results.items():
+        if not isinstance(summary, dict):
+            print('  {:<44} {}'.format(name, summary))
+            continue
+        line = '  {:<44} n={:<4} p50 {:>8.2f} ms  p90 {:>8.2f} ms  p99 {:>8.2f} ms'.format(
+            name, summary['n'], summary['p50_ms'], summary['p90_ms'], summary['p99_ms'])
+        if 'bytes_p50' in summary:
+            line += '  {:>8,} B'.format(summary['bytes_p50'])
+        old = (baseline or {}).get(name)
+        if isinstance(old, dict) and old.get('p50_ms'):
+            line += '  ({:+.0%} p50)'.format(summary['p50_ms'] / old['p50_ms'] - 1)
+        print(line)
+
+
+BENCHMARKS = OrderedDict([('import', bench_import),
+                          ('treemap', bench_treemap),
+                          ('plots', bench_plots),
+                          ('callbacks', bench_callbacks)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the app\'s hot paths.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='any of: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('-n', type=int, default=100, help='samples per benchmark (default: 100)')
+    parser.add_argument('--import-runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=209)
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<time>-<rev>.json)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to show p50 changes against')
+    parser.add_argument('--import-sections', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.import_sections:
+        print(json.dumps(import_sections()))
+        sys.exit(0)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {}'.format(name))
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    report = OrderedDict([
+        ('revision', git_revision()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('seed', args.seed),
+        ('n', args.n),
+        ('results', OrderedDict()),
+    ])
+    crypto = None
+    for name in (args.benchmarks or list(BENCHMARKS)):
+        if name == 'import':
+            results = bench_import(args)
+        else:
+            if crypto is None:
+                import crypto
+                report['data_version'] = crypto.data.current.version
+            results = BENCHMARKS[name](args, crypto)
+        report['results'][name] = results
+        print_table(name, results, baseline.get(name))
+
+    output = args.output
+    if output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, '{}-{}.json'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                                              report['revision'] or 'norev'))
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('\nResults written to {}'.format(output))
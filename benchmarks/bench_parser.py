@@ -0,0 +1,139 @@
+####################################################
+###      BITINFOCHARTS PARSER BENCHMARK          ###
+####################################################
+
+# Times the notebook's parsing (BeautifulSoup DOM + script index + regex +
+# parse_record with list appends) against scraper.parse_series on the same
+# page, and checks they agree.
+#
+#     python benchmarks/bench_parser.py [--records N] [--repeat R] [--page FILE]
+#
+# Without --page a synthetic page shaped like the real ones is used (the
+# data in the sixth script tag, surrounded by markup). The notebook variant
+# needs beautifulsoup4 and lxml and is skipped when they are missing.
+
+import os
+import re
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+def synthetic_page(records, seed=0):
+    rng = np.random.RandomState(seed)
+    days = np.datetime64('2009-01-03') + np.arange(records)
+    values = rng.lognormal(0, 2, records)
+    rows = []
+    for i, (day, value) in enumerate(zip(days, values)):
+        text = 'null' if i % 97 == 0 else '{:.4g}'.format(value)
+        rows.append('[new Date("{}"),{}]'.format(str(day).replace('-', '/'), text))
+    scripts = ''.join('<script>var x{} = {};</script>\n'.format(i, i) for i in range(5))
+    filler = '<div class="row"><a href="/comparison/x.html">link</a></div>\n' * 200
+    return ('<html><head>{}</head><body>{}<script>var d = new Dygraph(document.getElementById("container"), '
+            '[{}], {{labels: ["Date", "value"]}});</script>{}</body></html>').format(
+                scripts, filler, ','.join(rows), filler).encode('utf-8')
+
+
+################################
+##    Notebook implementation ##
+################################
+
+def parse_record(record):
+    date = record[11:21]
+    value = record[24:-1]
+    return [date, value]
+
+
+def notebook_parse(page):
+    soup = BeautifulSoup(page, 'lxml')
+    script_text = soup.findAll('script')[5].text
+    pattern = re.compile(r'\[new Date\("\d{4}/\d{2}/\d{2}"\),[(\d)(\w)-.]*\]')
+    data = {'date': [], 'value': []}
+    for record in pattern.findall(script_text):
+        parsed = parse_record(record)
+        if parsed[1] == 'null':
+            parsed[1] = None
+        else:
+            parsed[1] = float(parsed[1])
+        data['date'].append(parsed[0])
+        data['value'].append(parsed[1])
+    return data
+
+
+def regex_parse(page):
+    # The notebook's record loop over the decoded page, without the DOM
+    pattern = re.compile(r'\[new Date\("\d{4}/\d{2}/\d{2}"\),[(\d)(\w)-.]*\]')
+    data = {'date': [], 'value': []}
+    for record in pattern.findall(page.decode('utf-8')):
+        parsed = parse_record(record)
+        data['date'].append(parsed[0])
+        data['value'].append(None if parsed[1] == 'null' else float(parsed[1]))
+    return data
+
+
+def chunked_parse(page, size=65536):
+    return scraper.parse_series(page[i:i + size] for i in range(0, len(page), size))
+
+
+def timed(func, page, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(page)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same(data, dates, values):
+    expected_dates = np.array([d.replace('/', '-') for d in data['date']], dtype='datetime64[D]')
+    expected = np.array([np.nan if v is None else v for v in data['value']], dtype=np.float64)
+    return (np.array_equal(expected_dates, dates)
+            and np.allclose(expected, values, equal_nan=True, rtol=0, atol=0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark BitInfoCharts page parsing.')
+    parser.add_argument('--records', type=int, default=3500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--page', help='saved BitInfoCharts page to parse instead')
+    args = parser.parse_args()
+
+    if args.page:
+        with open(args.page, 'rb') as f:
+            page = f.read()
+    else:
+        page = synthetic_page(args.records)
+
+    variants = [('regex + appends', regex_parse),
+                ('parse_series', scraper.parse_series),
+                ('parse_series, 64K chunks', chunked_parse)]
+    if BeautifulSoup is not None:
+        variants.insert(0, ('notebook (bs4/lxml)', notebook_parse))
+    else:
+        print('beautifulsoup4/lxml not installed; skipping the notebook variant')
+
+    print('page: {:,} bytes'.format(len(page)))
+    baseline = None
+    reference = None
+    for name, func in variants:
+        seconds, result = timed(func, page, args.repeat)
+        if isinstance(result, dict):
+            reference = reference or result
+            count = len(result['date'])
+            check = ''
+        else:
+            count = len(result[0])
+            check = '' if reference is None else ('  ok' if same(reference, *result) else '  MISMATCH')
+        baseline = baseline or seconds
+        print('{:<26} {:>9.2f} ms  {:>7} records  {:>6.1f}x{}'.format(
+            name, seconds * 1000, count, baseline / seconds, check))
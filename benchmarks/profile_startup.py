@@ -0,0 +1,105 @@
+####################################################
+###            STARTUP PROFILER                  ###
+####################################################
+
+# Where a worker's boot goes: runs crypto.py one top-level statement at a
+# time, as importing it would, and reports wall time and memory allocated
+# (tracemalloc: net retained, plus the peak on Python 3.9+) for every import
+# statement and every #### section. An import is charged for everything it
+# pulls in first; on Python 3.7+ `python -X importtime -c 'import crypto'`
+# breaks that down further.
+#
+#     python benchmarks/profile_startup.py [--top N] [--json FILE]
+#
+# tracemalloc slows everything down; compare the wall times with each other,
+# not with bench_app.py's import benchmark. Run it on its own, in a fresh
+# interpreter, so nothing is imported already.
+
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from collections import OrderedDict
+
+from sections import section_starts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['DATA_RELOAD_INTERVAL'] = '0'
+os.environ['CACHE_WARMUP'] = '0'
+
+
+def statements(path):
+    """(section, label, code) of every top-level statement of path."""
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    starts = [(source.count('\n', 0, offset) + 1, name) for offset, name in section_starts(source)]
+    lines = source.splitlines()
+    for node in ast.parse(source, path).body:
+        section = [name for line, name in starts if line <= node.lineno][-1]
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            label = lines[node.lineno - 1].strip()
+        else:
+            label = None
+        module = ast.Module(body=[node], type_ignores=[])
+        yield section, label, compile(module, path, 'exec')
+
+
+def profile(path):
+    namespace = {'__name__': 'crypto', '__file__': path}
+    sys.modules['crypto'] = type(sys)('crypto')
+    # Peaks need tracemalloc.reset_peak (Python 3.9+)
+    peaks = hasattr(tracemalloc, 'reset_peak')
+    imports = OrderedDict()
+    sections = OrderedDict()
+    tracemalloc.start()
+    for section, label, code in statements(path):
+        if section not in sections:
+            sections[section] = {'ms': 0.0, 'kb': 0.0, 'peak_kb': None}
+            section_start, _ = tracemalloc.get_traced_memory()
+        if peaks:
+            tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        exec(code, namespace)
+        seconds = time.perf_counter() - start
+        after, peak = tracemalloc.get_traced_memory()
+        row = {'ms': seconds * 1000, 'kb': (after - before) / 1024.0,
+               'peak_kb': (peak - before) / 1024.0 if peaks else None}
+        if label is not None:
+            imports[label] = row
+        total = sections[section]
+        total['ms'] += row['ms']
+        total['kb'] += row['kb']
+        if peaks:
+            total['peak_kb'] = max(total['peak_kb'] or 0.0, (peak - section_start) / 1024.0)
+    tracemalloc.stop()
+    return imports, sections
+
+
+def print_rows(title, rows, top=None):
+    print('\n{:<52} {:>10} {:>12} {:>12}'.format(title, 'ms', 'KB kept', 'KB peak'))
+    items = list(rows.items())
+    if top:
+        items = sorted(items, key=lambda item: -item[1]['ms'])[:top]
+    for name, row in items:
+        peak = '-' if row['peak_kb'] is None else '{:,.0f}'.format(row['peak_kb'])
+        print('{:<52} {:>10.1f} {:>12,.0f} {:>12}'.format(name[:52], row['ms'], row['kb'], peak))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile the startup of crypto.py.')
+    parser.add_argument('--top', type=int, help='only show the N slowest imports')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    imports, sections = profile(os.path.join(ROOT, 'crypto.py'))
+    print_rows('import', imports, args.top)
+    print_rows('section', sections)
+    print('\ntotal {:.1f} ms'.format(sum(row['ms'] for row in sections.values())))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'imports': imports, 'sections': sections}, f, indent=1)
@@ -0,0 +1,17 @@
+####################################################
+###           CRYPTO.PY SECTION BANNERS          ###
+####################################################
+
+# crypto.py is divided into sections by banners like the one above.
+# bench_app.py (import time per section) and profile_startup.py (time and
+# memory per section) both split it here, so they always agree.
+
+import re
+
+BANNER = re.compile(r'^#{4,}\n###(.*?)###\n#{4,}\n', re.M)
+
+
+def section_starts(source):
+    """(offset, name) of every section of source, starting with 'imports'
+    for the code before the first banner."""
+    return [(0, 'imports')] + [(m.start(), m.group(1).strip()) for m in BANNER.finditer(source)]
@@ -0,0 +1,84 @@
+####################################################
+###                COIN REGISTRY                 ###
+####################################################
+
+# What the app knows about each coin: symbol, display name, chart color, its
+# BitInfoCharts page name and which daily metrics ('fees', 'times') have
+# data for it. The coins of the original charts are listed below. Coins that
+# only show up as columns in the data are registered as they are found, with
+# a generated color, so a new column in the CSVs is all it takes to chart a
+# coin.
+
+import colorsys
+from collections import OrderedDict
+
+
+class Coin(object):
+
+    def __init__(self, symbol, name=None, color=None, page=None, metrics=()):
+        self.symbol = symbol
+        self.name = name or symbol.upper()
+        self.color = color
+        # BitInfoCharts page name, as in /comparison/<page>-transactionfees.html
+        self.page = page
+        self.metrics = frozenset(metrics)
+
+    def __repr__(self):
+        return 'Coin({!r})'.format(self.symbol)
+
+
+def generated_color(i):
+    """Distinct, stable color for the i-th generated coin (golden-angle hues)."""
+    hue = (0.13 + i * 0.618033988749895) % 1.0
+    r, g, b = colorsys.hls_to_rgb(hue, 0.45 + 0.1 * (i % 3), 0.65)
+    return '#{:02x}{:02x}{:02x}'.format(int(r * 255), int(g * 255), int(b * 255))
+
+
+class CoinRegistry(object):
+    """Ordered symbol -> Coin mapping."""
+
+    def __init__(self, coins=()):
+        self.coins = OrderedDict((coin.symbol, coin) for coin in coins)
+
+    def __getitem__(self, symbol):
+        return self.coins[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.coins
+
+    def __iter__(self):
+        return iter(self.coins.values())
+
+    def __len__(self):
+        return len(self.coins)
+
+    def symbols(self, *metrics):
+        """Symbols of the coins with data for all of the given metrics."""
+        return [c.symbol for c in self if all(m in c.metrics for m in metrics)]
+
+    def colors(self, symbols):
+        return [self.coins[s].color for s in symbols]
+
+    def with_metric(self, metric, symbols):
+        """A copy that marks metric as available for symbols, registering
+        the ones not known yet."""
+        registry = CoinRegistry(Coin(c.symbol, c.name, c.color, c.page, c.metrics) for c in self)
+        generated = sum(1 for c in self if c.page is None)
+        for symbol in symbols:
+            if symbol not in registry:
+                registry.coins[symbol] = Coin(symbol, color=generated_color(generated))
+                generated += 1
+            coin = registry.coins[symbol]
+            coin.metrics = coin.metrics | {metric}
+        return registry
+
+
+KNOWN_COINS = CoinRegistry([
+    Coin('btc', 'Bitcoin', '#e41a1c', 'bitcoin'),
+    Coin('eth', 'Ethereum', '#377eb8', 'ethereum'),
+    Coin('bch', 'Bitcoin Cash', '#4daf4a', 'bitcoin%20cash'),
+    Coin('ltc', 'Litecoin', '#984ea3', 'litecoin'),
+    Coin('xmr', 'Monero', '#ff7f00', 'monero'),
+    Coin('dash', 'Dash', '#ffff33', 'dash'),
+    Coin('zec', 'Zcash', '#a65628', 'zcash'),
+])
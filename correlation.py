@@ -0,0 +1,94 @@
+####################################################
+###        ROLLING CROSS-COIN CORRELATIONS       ###
+####################################################
+
+# Daily returns of every coin aligned on one date axis (NaN where a coin has
+# no row), with running sums of the pair counts, x, x² and xy. The correlation
+# matrix of any date window is the difference of the sums at its two ends,
+# turned into Pearson coefficients by a few (coins x coins) array operations:
+# no pass over the rows inside the window, no DataFrame.corr. As in
+# DataFrame.corr, a pair only counts the days on which both coins moved.
+#
+# Sums for every day would take days x coins² memory each, so with many coins
+# they are kept every `stride` days only, as few as fit in MAX_BYTES. The at
+# most stride - 1 days between a window edge and the nearest kept sums are
+# folded in with one small matrix product each.
+
+import numpy as np
+
+from timeindex import TimeIndex
+
+# Memory budget of the running sums
+MAX_BYTES = 64 * 2**20
+# Pairs with fewer common days in a window get no coefficient
+MIN_PERIODS = 10
+
+# Stacked sums: pair counts, sum of x, sum of x², sum of xy
+N, SX, SXX, SXY = range(4)
+
+
+def _sums(x, v):
+    """The four (coins x coins) sums of a block of rows, or of a stack of
+    blocks. x holds the returns with 0 for missing days and v is 1 where a
+    return exists; entry [i, j] only counts days on which both coins moved."""
+    xt, vt = np.swapaxes(x, -1, -2), np.swapaxes(v, -1, -2)
+    return np.stack([np.matmul(vt, v), np.matmul(xt, v), np.matmul(xt * xt, v), np.matmul(xt, x)],
+                    axis=-3)
+
+
+class RollingCorrelation(object):
+
+    def __init__(self, epochs, returns, names, max_bytes=MAX_BYTES):
+        # epochs: sorted day starts; returns: (days x coins), NaN where missing
+        self.names = list(names)
+        self.index = TimeIndex(epochs)
+        returns = np.asarray(returns, dtype=np.float64)
+        valid = ~np.isnan(returns)
+        self.x = np.where(valid, returns, 0.0)
+        self.v = valid.astype(np.float64)
+        days, coins = returns.shape
+        checkpoint = 4 * coins * coins * 8
+        self.stride = max(1, int(np.ceil((days + 1) * checkpoint / float(max_bytes))))
+        # sums[k] covers the rows before k * stride
+        blocks = days // self.stride
+        shape = (blocks, self.stride, coins)
+        x = self.x[:blocks * self.stride].reshape(shape)
+        v = self.v[:blocks * self.stride].reshape(shape)
+        self.sums = np.concatenate([np.zeros((1, 4, coins, coins)),
+                                    np.cumsum(_sums(x, v), axis=0)])
+
+    @classmethod
+    def from_store(cls, store, column='change%', key='name', max_bytes=MAX_BYTES):
+        """Returns of every coin of a MarketStore, one column per coin in
+        store order."""
+        days, row = np.unique(store.columns['date'], return_inverse=True)
+        codes, col = np.unique(store.columns[key], return_inverse=True)
+        returns = np.full((len(days), len(codes)), np.nan)
+        returns[row, col] = store.columns[column]
+        return cls(days, returns, store.coins(), max_bytes)
+
+    def window_sums(self, lo, hi):
+        """The four sums over rows [lo, hi)."""
+        first = -(-lo // self.stride)
+        last = hi // self.stride
+        if first > last:
+            return _sums(self.x[lo:hi], self.v[lo:hi])
+        total = self.sums[last] - self.sums[first]
+        for a, b in ((lo, first * self.stride), (last * self.stride, hi)):
+            if b > a:
+                total = total + _sums(self.x[a:b], self.v[a:b])
+        return total
+
+    def matrix(self, start=None, end=None, min_periods=MIN_PERIODS):
+        """(coins x coins) correlations of the daily returns over
+        start <= date <= end, NaN for pairs with too few common days."""
+        lo, hi = self.index.range(start, end)
+        sums = self.window_sums(lo, hi)
+        n, sx, sxx, sxy = sums[N], sums[SX], sums[SXX], sums[SXY]
+        # Sums of the second coin of each pair are the transposes
+        cov = n * sxy - sx * sx.T
+        var = (n * sxx - sx * sx) * (n * sxx.T - sx.T * sx.T)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+        corr[(n < min_periods) | ~(var > 0)] = np.nan
+        return corr
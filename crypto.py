@@ -1,18 +1,36 @@
 import dash
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
-import dash_table
 import pandas as pd
 import numpy as np
 import plotly.graph_objs as go
-import plotly.tools as tools
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from dateutil.parser import parse
-import squarify
-import math
+import os
+import sys
+import gc
+import copy
 from datetime import datetime
-from bisect import bisect_left
 import grasia_dash_components as gdc
+import datastore
+import figcache
+import downsample
+import serving
+import metrics
+import warmup
+import sharedstore
+import staticassets
+from timeindex import TimeIndex, epoch_seconds
+from rangestats import RangeMeans
+from pyramid import Pyramid
+from coins import KNOWN_COINS
+from markets import MarketStore
+from correlation import RollingCorrelation
+from analytics import VolatilityStats
+from treemaps import TreemapLayouts
+from snapshot import Snapshot, Reloader
 
 ####################################################
 ### 			DASH SETUP CODE					 ###
@@ -23,10 +41,68 @@ import grasia_dash_components as gdc
 
 # Setup the Dash application
 #app = dash.Dash(__name__, external_stylesheets=external_stylesheets, static_folder='static')
-app = dash.Dash(__name__, static_folder='static')
+# webslides.css/js are linked below under their fingerprinted URLs instead of
+# Dash's /assets ones
+app = dash.Dash(__name__, static_folder='static', assets_ignore=r'^webslides\.(css|js)$')
 app.title = 'Bitcoin Booms and Busts'
 server = app.server
 
+# Files in static/ and assets/ are served from content-hashed URLs with
+# year-long immutable caching, text pre-compressed and images as WebP where
+# accepted (see staticassets.py). The layout links them through asset_url
+static_assets = staticassets.load()
+static_assets.serve(server)
+asset_url = static_assets.url
+
+app.css.append_css({'external_url': asset_url('/assets/webslides.css')})
+app.scripts.append_script({'external_url': asset_url('/assets/webslides.js')})
+# Used by fastCheapSync.js and lazySlides.js, which are imported later
+app.scripts.append_script({'external_url': asset_url('/static/reactInput.js')})
+
+def asset_img(path, sizes=None, **props):
+    # Narrower copies are offered through srcset where the build made them;
+    # sizes tells the browser how wide the image is drawn
+    srcset = static_assets.srcset(path)
+    if srcset is not None:
+        props['srcSet'] = srcset
+        if sizes is not None:
+            props['sizes'] = sizes
+    return html.Img(src=asset_url(path), **props)
+
+####################################################
+### 			DATA LOADING					 ###
+####################################################
+
+# All CSV inputs are compiled into a memory-mapped columnar bundle
+# (see datastore.py) instead of being parsed here on every boot. Everything
+# derived from it lives in an immutable Snapshot (built by load_data below)
+# that the reloader swaps out when the CSVs change; callbacks read
+# data.current once and use that snapshot throughout.
+
+# Serialized figures are memoized per worker and in a local directory shared
+# by all workers; keys carry the version of the tables a figure is built
+# from, so new data never hits stale entries and unchanged tables keep theirs,
+# and the code version, so the disk tier never outlives a changed builder.
+# The per-worker tier is bounded in bytes (FIGURE_CACHE_MB, default 32)
+code_version = sharedstore.code_version()
+figure_cache = figcache.TwoTierCache(
+    figcache.LRUCache(maxsize=1024, max_bytes=int(os.environ.get('FIGURE_CACHE_MB', 32)) * 1024 * 1024),
+    figcache.DiskCache(os.path.join(datastore.BASE_DIR, '.figcache')))
+
+# Interactive slides start with an empty placeholder figure; the real ones are
+# fetched when static/lazySlides.js sees the visitor approaching the slide
+def placeholder_figure(title=None):
+    return {'data': [],
+            'layout': {'title': title,
+                       'xaxis': {'visible': False},
+                       'yaxis': {'visible': False},
+                       'paper_bgcolor': '#f7f9fb',
+                       'plot_bgcolor': '#f7f9fb'}}
+
+def lazy_trigger(id):
+    # Hidden input that lazySlides.js fills in once the slide is due
+    return dcc.Input(id=id, type='text', value='', style={'display': 'none'})
+
 
 ####################################################
 ### 		DESCENTRALIZED VIZ CODE				 ###
@@ -53,51 +129,33 @@ df_table = pd.DataFrame(table)
 df_table.columns = df_table.iloc[0]
 df_table = df_table[1:]
 
-df_val_per_month = pd.read_csv('change_bins_values_per_month.csv')
-df_val_per_month.fillna(0, inplace=True)
-df_val_per_month.loc[:,"_0_to_1":"More_10000"] = df_val_per_month.loc[:,"_0_to_1":"More_10000"].div(df_val_per_month.sum(axis=1), axis=0) * 100
-df_val_per_month.columns = ["Month", "Planktons", "Clownfishes",
-                            "Lionfishes", "Swordfishes", "Sharks", "Whales"]
-df_val_per_month = df_val_per_month.sort_values(by='Month')
-df_val_per_month.Month = pd.to_datetime(df_val_per_month.Month)
-df_val_per_month = df_val_per_month.set_index(['Month'])
-
-df_ct_per_month = pd.read_csv('change_count_bins_per_month.csv')
-df_ct_per_month.fillna(0, inplace=True)
-df_ct_per_month.loc[:,"_0_to_1":"More_10000"] = df_ct_per_month.loc[:,"_0_to_1":"More_10000"].div(df_ct_per_month.sum(axis=1), axis=0) * 100
-df_ct_per_month.columns = ["Month", "Planktons", "Clownfishes",
-                            "Lionfishes", "Swordfishes", "Sharks", "Whales"]
-df_ct_per_month = df_ct_per_month.sort_values(by='Month')
-df_ct_per_month.Month = pd.to_datetime(df_ct_per_month.Month)
-df_ct_per_month = df_ct_per_month.set_index(['Month'])
-
-epoch = datetime.utcfromtimestamp(0)
-
-
-def unix_time_millis(dt):
-    return (dt - epoch).total_seconds()
-
-def timestamp_millis(unix_ts):
-    ts = datetime.utcfromtimestamp(unix_ts).strftime('%Y-%m-%d')
-    return pd.to_datetime(ts)
-
-
-def build_treemap(date, dataset, x, y, width, height, title):
+# The treemaps can step through monthly or weekly snapshots of the bins
+treemap_tables = {('month', 'values'): 'val_per_month',
+                  ('month', 'count'): 'ct_per_month',
+                  ('week', 'values'): 'val_per_week',
+                  ('week', 'count'): 'ct_per_week'}
+granularities = [{'label': 'Monthly', 'value': 'month'},
+                 {'label': 'Weekly', 'value': 'week'}]
+granularity_labels = {'month': '%B %Y', 'week': '%d %b %Y'}
+# About this many labelled marks on the slider, whatever the granularity
+slider_marks = 22
+
+def load_decentralized(bundle):
+    # Share matrices with their epoch-second lookups and squarified
+    # rectangles, shared by the slider, callbacks and build_treemap
+    return dict(treemaps=dict(
+        (key, TreemapLayouts.from_bundle(bundle, table, datastore.BIN_COLUMNS,
+                                         x=tm_x, y=tm_y, width=tm_width, height=tm_height))
+        for key, table in treemap_tables.items()))
+
+def build_treemap(layouts, pos, title):
 
     shapes = []
     counter = 0
     annotations = []
 
-    month = timestamp_millis(date)
-
-    if dataset == 'values':
-        values = df_val_per_month.loc[month]
-    else:
-        values = df_ct_per_month.loc[month]
-
-    cValues = [x + 0.0000001 for x in values]
-    normed = squarify.normalize_sizes(cValues, width, height)
-    rects = squarify.squarify(normed, x, y, width, height)
+    values, rects = layouts.snapshot(pos)
+    rects = [dict(zip(('x', 'y', 'dx', 'dy'), r)) for r in rects.tolist()]
 
     for r in rects:
         shapes.append(
@@ -131,7 +189,7 @@ def build_treemap(date, dataset, x, y, width, height, title):
         'data': [go.Scatter(
             x=[r['x']+(r['dx']/2) for r in rects],
             y=[r['y']+(r['dy']/2) for r in rects],
-            text=[v + '\n' + '{:.2f}'.format(values.get(v)) + '%' for v in values.keys()],
+            text=[v + '\n' + '{:.2f}'.format(value) + '%' for v, value in zip(layouts.names, values)],
             mode='none',
             hoverinfo='text',
             )
@@ -160,15 +218,81 @@ def build_treemap(date, dataset, x, y, width, height, title):
 
     return figure
 
-decentralizedviz = html.Div(className='wrap',children=[
+# Treemaps only change with the snapshot, so each (dataset, snapshot) figure
+# is built once and kept serialized; slider callbacks just look up the bytes
+treemap_titles = {'values': '% of Total Volume', 'count': '% of Total Users'}
+
+def treemap_json(snap, date, dataset, granularity='month'):
+    if granularity not in granularity_labels:
+        granularity = 'month'
+    layouts = snap.treemaps[(granularity, dataset)]
+    pos = layouts.index.nearest_pos(date)
+    key = (code_version, snap.bundle.table_version(treemap_tables[(granularity, dataset)]), 'treemap',
+           dataset, granularity, int(layouts.index.epochs[pos]))
+    return figure_cache.get_or_build(key, lambda: build_treemap(layouts, pos, treemap_titles[dataset]))
+
+# Animation mode (static/treemapAnimation.js) plays and scrubs the treemaps in
+# the browser. It fetches every snapshot of a granularity at once, as shares
+# and rectangles only; the script expands them into Plotly frames
+def treemap_frames(snap, granularity):
+    frames = {'granularity': granularity,
+              'names': datastore.BIN_COLUMNS,
+              'colors': cList,
+              'titles': treemap_titles,
+              'values': {},
+              'rects': {}}
+    for dataset in treemap_titles:
+        layouts = snap.treemaps[(granularity, dataset)]
+        frames['values'][dataset] = np.round(layouts.values, 2).tolist()
+        # x, y, dx, dy of every bin, flattened per snapshot
+        frames['rects'][dataset] = np.round(layouts.rects, 3).reshape(len(layouts), -1).tolist()
+    index = snap.treemaps[(granularity, 'count')].index
+    frames['epochs'] = index.epochs.tolist()
+    frames['labels'] = [datetime.utcfromtimestamp(e).strftime(granularity_labels[granularity])
+                        for e in index.epochs]
+    return frames
+
+frame_payloads = figcache.LRUCache(maxsize=8)
+
+@server.route('/_treemap-frames/<granularity>.json')
+def serve_treemap_frames(granularity):
+    if granularity not in granularity_labels:
+        flask.abort(404)
+    snap = data.current
+    key = (snap.bundle.table_version(*[treemap_tables[(granularity, d)] for d in treemap_titles]), granularity)
+    payload = frame_payloads.get(key)
+    if payload is None:
+        payload = serving.PrecompressedPayload(figcache.to_json_bytes(treemap_frames(snap, granularity)))
+        frame_payloads.put(key, payload)
+    return payload.response()
+
+def date_slider(snap, granularity='month', value=None):
+    index = snap.treemaps[(granularity, 'count')].index
+    step = int(np.ceil(len(index) / float(slider_marks)))
+    return dcc.Slider(
+                            id='date_slider',
+                            # Read back by update_date_slider
+                            className='date-slider-' + granularity,
+                            min=index.first,
+                            max=index.last,
+                            value=index.last if value is None else index.nearest(value),
+                            marks={int(e): {'label': datetime.utcfromtimestamp(e).strftime(granularity_labels[granularity]),
+                                            'style': {  'transform': 'rotate(-45deg) translate(-45px, -10px)',
+                                                      'text-align': 'right',
+                                                      'white-space': 'nowrap'}} for e in index.epochs[0:len(index):step]},
+                            included=True,
+                            updatemode='mouseup'
+                        )
+
+def decentralized_viz(snap):
+    return html.Div(className='wrap',children=[
                         html.H2('Are Bitcoins Decentralized?'),
                         html.P('By dragging the slider, we can see how Bitcoin is evolving towards more centralization.',className='text-intro'),
                         html.Div(className='grid',children=[
                             html.Div(className='column',children=[
                                 dcc.Graph(
                                     id='cpm_treemap',
-                                    figure=build_treemap(unix_time_millis(df_ct_per_month.index[-1]),
-                                                         'count', tm_x, tm_y, tm_width, tm_height,'% of Total Users'),
+                                    figure=placeholder_figure('% of Total Users'),
                                     config={
                                         'displayModeBar': False
                                     }
@@ -177,26 +301,23 @@ decentralizedviz = html.Div(className='wrap',children=[
                             html.Div(className='column',children=[
                                 dcc.Graph(
                                     id='vpm_treemap',
-                                    figure=build_treemap(unix_time_millis(df_val_per_month.index[-1]),
-                                                         'values', tm_x, tm_y, tm_width, tm_height, '% of Total Volume'),
+                                    figure=placeholder_figure('% of Total Volume'),
                                     config={
                                         'displayModeBar': False
                                     }
                                 )
                             ])
                         ]),
-                        html.Div(dcc.Slider(
-                            id='date_slider',
-                            min=unix_time_millis(df_ct_per_month.index.min()),
-                            max=unix_time_millis(df_ct_per_month.index.max()),
-                            value=unix_time_millis(df_ct_per_month.index.max()),
-                            marks={int(unix_time_millis(d)): {'label': d.strftime('%B %Y'),
-                                                              'style': {  'transform': 'rotate(-45deg) translate(-45px, -10px)',
-                                                                        'text-align': 'right',
-                                                                        'white-space': 'nowrap'}} for d in df_ct_per_month.index[0:len(df_ct_per_month):5]},
-                            included=True,
-                            updatemode='mouseup'
-                        ))
+                        html.Div(id='date_slider_container',children=date_slider(snap)),
+                        dcc.RadioItems(
+                            id='treemap_granularity',
+                            options=granularities,
+                            value='month',
+                            labelStyle={'display': 'inline-block', 'margin-right': '1rem'}
+                        ),
+                        # Filled in by static/treemapAnimation.js
+                        html.Div(id='treemap_player',className='aligncenter'),
+                        lazy_trigger('load_decentralized')
                     ])
 
 
@@ -204,9 +325,103 @@ decentralizedviz = html.Div(className='wrap',children=[
 ### 			STORE VALUE VIZ CODE			 ###
 ####################################################
 
-df_storevalue = pd.read_csv('crypto10-markets-am.csv')
+def load_storevalue_data(bundle, previous=None):
+    market_store = MarketStore.from_bundle(bundle)
+    # Figures quoted on the store value slides. The running stats of the
+    # previous snapshot are copied and only fed the rows added since
+    if previous is None:
+        volatility = VolatilityStats()
+    elif previous.bundle.table_version('markets') == bundle.table_version('markets'):
+        volatility = previous.volatility
+    else:
+        volatility = copy.deepcopy(previous.volatility)
+    volatility.update(market_store)
+    storevalue_min, storevalue_max = [datetime.utcfromtimestamp(t).date()
+                                      for t in market_store.date_bounds()]
+    return dict(market_store=market_store,
+                storevalue_coins=market_store.coins(),
+                storevalue_min=storevalue_min,
+                storevalue_max=storevalue_max,
+                volatility=volatility,
+                volatility_summary=volatility.summary(),
+                # Running sums behind the correlation heatmap
+                correlations=RollingCorrelation.from_store(market_store))
+
+# Approximate plot area width of the store value graph, in pixels
+storevalue_width = 1000
+
+def storevalue_trace(snap, name, start=None, end=None):
+    coin = snap.market_store.slice(name, start, end, ['date', 'change%'])
+    idx = downsample.downsample_indices(coin['change%'],
+                                        downsample.points_for_width(storevalue_width))
+    dates = coin['date'][idx].astype('datetime64[s]').astype('datetime64[D]')
+    return go.Scatter(x=np.datetime_as_string(dates), y=coin['change%'][idx], name=name)
+
+def build_storevalue(snap, coins=None, start=None, end=None):
+    if coins is None:
+        coins = snap.storevalue_coins
+    return {'data': [storevalue_trace(snap, i, start, end) for i in coins],
+            'layout': go.Layout(
+                paper_bgcolor='#f7f9fb',
+                plot_bgcolor='#f7f9fb',
+                xaxis={'type': 'date', 'title': 'Date'},
+                yaxis={'type': 'linear', 'title': '% Change in Day', 'tickformat': ',.000001%'},
+                margin={'l': 100, 'b': 40, 't': 10, 'r': 10},
+                legend={'x': 0, 'y': 1},
+                hovermode='closest')
+    }
 
-storevalueviz = html.Div(children = [
+def build_correlation(snap, start=None, end=None):
+    names = snap.correlations.names
+    return {'data': [go.Heatmap(x=names, y=names, z=snap.correlations.matrix(start, end),
+                                zmin=-1, zmax=1, colorscale='RdBu',
+                                colorbar={'title': 'Correlation'})],
+            'layout': go.Layout(
+                paper_bgcolor='#f7f9fb',
+                plot_bgcolor='#f7f9fb',
+                xaxis={'type': 'category'},
+                # Diagonal from the top left, like a printed matrix
+                yaxis={'type': 'category', 'autorange': 'reversed'},
+                margin={'l': 100, 'b': 100, 't': 10, 'r': 10},
+                hovermode='closest')
+    }
+
+def swing(point):
+    when = datetime.strptime(point['date'], '%Y-%m-%d').strftime('%B %Y')
+    return '{:.2%} ({})'.format(point['value'], when)
+
+def drop(point):
+    # A fall quoted as a positive percentage ("the biggest daily drop of 20%")
+    return swing(dict(point, value=-point['value']))
+
+def store_value_swings(stats):
+    market = stats['market']
+    return ('Combining the market cap of the top 10 cryptos, the biggest up swing in prices in a day was {}, while '
+            'the biggest downswing was {}. For a rough comparison, the biggest upswing for the Dow Jones Industrial '
+            'Average was 15.34% (1933), while the biggest downswing was −22.61% (1987).').format(
+                swing(market['max_up']), swing(market['max_down']))
+
+def store_value_extremes(stats):
+    up, down = stats['top_up'], stats['top_down']
+    btc = stats['coins']['Bitcoin']
+    return ('If we focus only on the top 10 largest currencies, their volatility in prices is noticeable, with {} having the '
+            'highest daily upswing in prices of {} and {} having the biggest daily drop of {}. Even Bitcoin fell {} '
+            'below its previous high, and over its most volatile 30 days its daily price changes had a standard '
+            'deviation of {}.').format(
+                up, swing(stats['coins'][up]['max_up']), down, drop(stats['coins'][down]['max_down']),
+                swing(btc['max_drawdown']), swing(btc['volatility']['30']['max']))
+
+def store_value_conclusion(stats):
+    top = stats['coins'][stats['top_up']]['max_up']['value']
+    return ('Cryptocurrency prices are very volatile, with even top 10 cryptos swinging in price as much as {:.0%} in a given day. '
+            'While they might be reasonably good speculative assets, their price instability make them a difficult store of value. '
+            'This is exemplified by the fact that of crypto currencies went from $10B in May 2016 to $100B in June 2017 to $800B in '
+            'January 2018. And it now back to just over $100B in December 2018.').format(top)
+
+def storevalue_viz(snap):
+    storevalue_coins = snap.storevalue_coins
+    storevalue_min, storevalue_max = snap.storevalue_min, snap.storevalue_max
+    return html.Div(children = [
     html.H2('How volatile are crypto prices?'),
     html.Div(children='''
         % Change in Prices by Day for Top 10 Cryptocurrencies by Market Cap (2013-2018)
@@ -215,110 +430,175 @@ storevalueviz = html.Div(children = [
         You can click on the currency names on the legends to add/eliminate them from the graph.
     '''),
 
+    html.Div([
+        dcc.Dropdown(
+            id='storevalue_coins',
+            options=[{'label': i, 'value': i} for i in storevalue_coins],
+            value=storevalue_coins,
+            multi=True
+        ),
+        dcc.Input(
+            id='storevalue_start',
+            type='date',
+            min=str(storevalue_min),
+            max=str(storevalue_max),
+            value=str(storevalue_min)
+        ),
+        dcc.Input(
+            id='storevalue_end',
+            type='date',
+            min=str(storevalue_min),
+            max=str(storevalue_max),
+            value=str(storevalue_max)
+        )
+    ]),
+
     # graph 1
     dcc.Graph(
         id='change',
         config = {
             'displaylogo': False
         },
-        figure={'data': [go.Scatter(
-            x = df_storevalue[df_storevalue['name'] == i].date,
-            y = df_storevalue[df_storevalue['name'] == i]['change%'],
-            name=i
-        )
-        for i in df_storevalue.name.unique()],
+        figure=placeholder_figure()
+    ),
 
+    html.H3('Do they move together?'),
+    html.Div(children='''
+        Correlation of the daily % change in prices of each pair of cryptocurrencies over the selected dates.
+    '''),
+    html.Div([
+        dcc.Input(
+            id='correlation_start',
+            type='date',
+            min=str(storevalue_min),
+            max=str(storevalue_max),
+            value=str(storevalue_min)
+        ),
+        dcc.Input(
+            id='correlation_end',
+            type='date',
+            min=str(storevalue_min),
+            max=str(storevalue_max),
+            value=str(storevalue_max)
+        )
+    ]),
 
-                'layout': go.Layout(
-				paper_bgcolor='#f7f9fb',
-		    	plot_bgcolor='#f7f9fb',
-                xaxis={'type': 'date', 'title': 'Date'},
-                yaxis={'type': 'linear', 'title': '% Change in Day', 'tickformat': ',.000001%'},
-                margin={'l': 100, 'b': 40, 't': 10, 'r': 10},
-                legend={'x': 0, 'y': 1},
-                hovermode='closest')
-
-        }
-    )
+    # graph 2
+    dcc.Graph(
+        id='correlation',
+        config = {
+            'displaylogo': False
+        },
+        figure=placeholder_figure()
+    ),
+    lazy_trigger('load_storevalue')
 ])
 
 ####################################################
 ### 		FAST AND CHEAP VIZ CODE				 ###
 ####################################################
 
-df_fees = pd.read_csv('avg_transaction_fee.csv')
-df_times = pd.read_csv('block_times.csv')
-df_fees['date'] = pd.to_datetime(df_fees['date'],format='%Y/%m/%d')
-df_times['date'] = pd.to_datetime(df_times['date'],format='%Y/%m/%d')
-
-min_date = min(df_fees.min()['date'],df_times.min()['date'])
-max_date = max(df_fees.max()['date'],df_times.max()['date'])
-
-cryptos = {'btc':{'color':'#e41a1c'},
-           'eth':{'color':'#377eb8'},
-           'bch':{'color':'#4daf4a'},
-           'ltc':{'color':'#984ea3'},
-           'xmr':{'color':'#ff7f00'},
-           'dash':{'color':'#ffff33'},
-           'zec':{'color':'#a65628'}}
+# Every coin with both a fees and a times column is charted, the ones listed
+# in coins.py first (with their colors) and any other column after them
+def load_fastcheap(bundle):
+    df_fees = bundle.frame('fees')
+    df_times = bundle.frame('times')
+    registry = (KNOWN_COINS.with_metric('fees', [c for c in df_fees.columns if c != 'date'])
+                           .with_metric('times', [c for c in df_times.columns if c != 'date']))
+    symbols = registry.symbols('fees', 'times')
+    fees_index = TimeIndex.from_datetimes(df_fees['date'])
+    times_index = TimeIndex.from_datetimes(df_times['date'])
+    return dict(
+        coin_registry=registry,
+        min_date=min(df_fees['date'].min(),df_times['date'].min()),
+        max_date=max(df_fees['date'].max(),df_times['date'].max()),
+        # Prefix sums behind the mean block time / mean fee scatter, so any
+        # date window costs the same
+        time_means=RangeMeans.from_frame(times_index, df_times, symbols),
+        fee_means=RangeMeans.from_frame(fees_index, df_fees, symbols),
+        # Daily/weekly/monthly aggregates the time series are drawn from
+        time_pyramid=Pyramid.from_frame(times_index, df_times, symbols),
+        fee_pyramid=Pyramid.from_frame(fees_index, df_fees, symbols))
+
+# Past this many time series points in one figure the traces are drawn with
+# WebGL (scattergl) instead of SVG, which stops keeping up long before that
+webgl_points = int(os.environ.get('WEBGL_POINTS', 20000))
+
+def window_series(block, col, max_points):
+    # Trace data of one coin out of a Pyramid.window block
+    y = block['y'][:, col]
+    if block['daily']:
+        if len(y) > max_points:
+            idx = downsample.downsample_indices(y, max_points)
+            return {'x': block['x'][idx], 'y': y[idx]}
+        return {'x': block['x'], 'y': y}
+    return {'x': block['x'], 'y': y,
+            'error_y': {'type': 'data', 'symmetric': False,
+                        'array': block['plus'][:, col],
+                        'arrayminus': block['minus'][:, col],
+                        'thickness': 1, 'width': 0}}
+
+def build_plots(snap,height=600,width=1400,initial_date=None,end_date=None,zoom=False):
+    if (zoom):
+        series_start, series_end = initial_date, end_date
+    else:
+        series_start, series_end = None, None
+
+    # Cap the time series to what the left panels can actually draw, and
+    # read them from the coarsest aggregate level that still has enough
+    # points for the window
+    max_points = downsample.points_for_width(width * 0.45)
+    min_points = max_points // 10
+
+    symbols = snap.coin_registry.symbols('fees', 'times')
+    colors = snap.coin_registry.colors(symbols)
+    # Means, bucket stats and error bars of all coins come out of one 2-D
+    # slice per table; the loop below only picks columns
+    mean_times = snap.time_means.mean_array(initial_date, end_date)
+    mean_fees = snap.fee_means.mean_array(initial_date, end_date)
+    times_block = snap.time_pyramid.window(series_start, series_end, min_points)
+    fees_block = snap.fee_pyramid.window(series_start, series_end, min_points)
+    times_series = [window_series(times_block, col, max_points) for col in range(len(symbols))]
+    fees_series = [window_series(fees_block, col, max_points) for col in range(len(symbols))]
+    points = sum(len(series['x']) for series in times_series + fees_series)
+    trace_type = 'scattergl' if points > webgl_points else 'scatter'
 
-def build_plots(height=600,width=1400,initial_date=None,end_date=None,zoom=False):
     traces = []
-    if (initial_date is not None) and (end_date is not None):
-        if (zoom):
-            df_times_series = df_times[((df_times['date'] >= initial_date) & (df_times['date'] <= end_date))]
-            df_fees_series = df_fees[((df_fees['date'] >= initial_date) & (df_fees['date'] <= end_date))]
-        else:
-            df_times_series = df_times
-            df_fees_series = df_fees
-        df_times_plot = df_times[((df_times['date'] >= initial_date) & (df_times['date'] <= end_date))]
-        df_fees_plot = df_fees[((df_fees['date'] >= initial_date) & (df_fees['date'] <= end_date))]
-    else:
-        df_times_series = df_times
-        df_fees_series = df_fees
-        df_times_plot = df_times
-        df_fees_plot = df_fees
-
-    max_fee = 0
-    max_time = 0
-    for i in cryptos:
-        mean_time = df_times_plot[i].mean()
-        mean_fee = df_fees_plot[i].mean()
-        if mean_time > max_time:
-            max_time = mean_time
-        if mean_fee > max_fee:
-            max_fee = mean_fee
-        traces.append(go.Scatter({'x':df_times_series['date'],
-                             'y':df_times_series[i],
-                             #'text':i.upper(),
-                             'name':i.upper(),
-                             'legendgroup':i.upper(),
-                             'xaxis':'x1',
+    for col, symbol in enumerate(symbols):
+        name, color = symbol.upper(), colors[col]
+        for series in (times_series[col], fees_series[col]):
+            if 'error_y' in series:
+                series['error_y']['color'] = color
+        traces.append(dict(times_series[col], **{
+                             'type':trace_type,
+                             'name':name,
+                             'legendgroup':name,
+                             'xaxis':'x',
                              'yaxis':'y3',
-                             'line':{'color':cryptos[i]['color']},
+                             'line':{'color':color},
                              'showlegend':False}))
-        traces.append(go.Scatter({'x':[mean_time],
-                             'y':[mean_fee],
-                             #'text':i.upper(),
-                             'name':i.upper(),
-                             'legendgroup':i.upper(),
-                             'mode':'markers',
-                             'opacity':1.0,
-                             'marker':{'size':15,'color':cryptos[i]['color'],'line':{'width':0.5,'color':'black'}},
-                             'xaxis':'x2',
-                             'yaxis':'y2'}))
-        traces.append(go.Scatter({'x':df_fees_series['date'],
-                             'y':df_fees_series[i],
-                             #'text':i.upper(),
-                             'name':i.upper(),
-                             'legendgroup':i.upper(),
-                             'xaxis':'x1',
-                             'yaxis':'y1',
-                             'line':{'color':cryptos[i]['color']},
+        traces.append({'type':trace_type,
+                       'x':[mean_times[col]],
+                       'y':[mean_fees[col]],
+                       'name':name,
+                       'legendgroup':name,
+                       'mode':'markers',
+                       'opacity':1.0,
+                       'marker':{'size':15,'color':color,'line':{'width':0.5,'color':'black'}},
+                       'xaxis':'x2',
+                       'yaxis':'y2'})
+        traces.append(dict(fees_series[col], **{
+                             'type':trace_type,
+                             'name':name,
+                             'legendgroup':name,
+                             'xaxis':'x',
+                             'yaxis':'y',
+                             'line':{'color':color},
                              'showlegend':False}))
 
-    range_y2 = max_fee*1.1
-    range_x2 = max_time*1.1
+    # Coins with no data in the window (NaN means) are left out of the ranges
+    range_y2 = np.nanmax(np.append(mean_fees, 0.0))*1.1
+    range_x2 = np.nanmax(np.append(mean_times, 0.0))*1.1
 
     layout = go.Layout(
         #width=width,
@@ -360,7 +640,7 @@ def build_plots(height=600,width=1400,initial_date=None,end_date=None,zoom=False
             title='Avg. Block Times (min)'
         ),
         images= [dict(
-                  source= "/assets/fastcheap_back.png",
+                  source= asset_url("/assets/fastcheap_back.png"),
                   xref= "x2",
                   yref= "y2",
                   yanchor="bottom",
@@ -375,11 +655,12 @@ def build_plots(height=600,width=1400,initial_date=None,end_date=None,zoom=False
     	plot_bgcolor='#f7f9fb'
     )
 
-    return go.Figure(data=traces,layout=layout)
+    # A plain dict: go.Figure would validate every trace again
+    return {'data': traces, 'layout': layout}
 
-initial_figure = build_plots()
-
-fastcheapviz = html.Div(className='wrap',children=[
+def fastcheap_viz(snap):
+    min_date, max_date = snap.min_date, snap.max_date
+    return html.Div(className='wrap',children=[
                         html.H2('Fast and Cheap Transactions'),
                         html.P('''On the left side, you can visualize time series on historical data for block times (the amount of time it takes for a
                         transaction to show up on a block, thus being confirmed) and the fee charged for that transaction. On the right side, the
@@ -391,9 +672,9 @@ fastcheapviz = html.Div(className='wrap',children=[
             						dcc.Input(
             		                    id='start_date_input',
             							type='date',
-            		                    min=min_date,
-            		                    max=max_date,
-            							value=min_date
+            		                    min=str(min_date.date()),
+            		                    max=str(max_date.date()),
+            							value=str(min_date.date())
             	                	)
             					],style={'padding-top':'1rem','padding-bottom':'1rem'}),
             					html.Li([
@@ -401,15 +682,15 @@ fastcheapviz = html.Div(className='wrap',children=[
             						dcc.Input(
             				            id='end_date_input',
             							type='date',
-            				            min=min_date,
-            				            max=max_date,
-            							value=max_date
+            				            min=str(min_date.date()),
+            				            max=str(max_date.date()),
+            							value=str(max_date.date())
             			        	)
             					],style={'padding-top':'1rem','padding-bottom':'1rem'})]
             				),
                             dcc.Graph(
                                 id='fastandcheap',
-                                figure=initial_figure,
+                                figure=placeholder_figure(),
                                 config={
                                     'displayModeBar': False
                                 }
@@ -442,11 +723,10 @@ navbar = html.Header([
 
 # This sets up the code for the slides
 
-slides = []
 
 ## SLIDE 1: Title Slide`
 slide1 = html.Section([
-				html.Img(src='/static/bitcoin_logo.svg',width='10%',height='10%',className='aligncenter'),
+				asset_img('/static/bitcoin_logo.svg',width='10%',height='10%',className='aligncenter'),
 				html.H1(html.Strong('Bitcoin Booms and Busts')),
 				html.Hr(),
 				html.H5('University of California, Berkeley'),
@@ -498,24 +778,24 @@ slide3 = html.Section([navbar,
                                     ''']),
                                     html.Ul(className='flexblock specs',children=[
                                         html.Li(html.Div([
-                                            html.Img(src='/static/decentralized.svg'),
+                                            asset_img('/static/decentralized.svg'),
                                             html.H2('Decentralized'),
                                             'Not controlled by any particular entity, so not subject to manipulation'
                                         ])),
                                         html.Li(html.Div([
-                                            html.Img(src='/static/storevalue.svg'),
+                                            asset_img('/static/storevalue.svg'),
                                             html.H2('Store of Value'),
                                             'Should work as a store of value (with proponents likening it to gold)'
                                         ])),
                                         html.Li(html.Div([
-                                            html.Img(src='/static/transactions.svg'),
+                                            asset_img('/static/transactions.svg'),
                                             html.H2('Fast and Cheap Transactions'),
                                             'Fast and affordable transactions, relying on the public blockchain'
                                         ]))
                                     ])
                                 ]),
                                 html.Div(className='flex-content',children=[
-                                    html.Figure(html.Img(className='alignright size-75',src='/static/bitcoin_pile.png',alt='Bitcoin'))
+                                    html.Figure(asset_img('/static/bitcoin_pile.png',sizes='75vw',className='alignright size-75',alt='Bitcoin'))
                                 ])
                             ])
                         ])
@@ -524,7 +804,7 @@ slide3 = html.Section([navbar,
 ## SLIDE 4: Decentralization Story
 slide4 = html.Section(className='bg-light',style={'background-color':'#edf2f7'},children=[navbar,
             html.Div(className='wrap',children=[
-                html.Img(className='alignleft size-50',src='/static/wallets_count.svg'),
+                asset_img('/static/wallets_count.svg',className='alignleft size-50'),
                 html.H2(html.Strong('Are Bitcoins Decentralized?')),
                 html.P(['Analyzing transaction data from ',html.A('January 2009 to september 2018',href='https://cloud.google.com/blog/products/gcp/bitcoin-in-bigquery-blockchain-analytics-on-public-data'),'.',
                             html.Br(),html.Br(),
@@ -538,11 +818,14 @@ slide4 = html.Section(className='bg-light',style={'background-color':'#edf2f7'},
             ])
 
 ## SLIDE 5: Decentralized Visualization
-slide5 = html.Section([navbar,decentralizedviz])
+def slide5(snap):
+    return html.Section([navbar,decentralized_viz(snap)])
 
 ## SLIDE 6: Store Value Story
-slide6 = html.Section(className='fullscreen bg-apple',children=[navbar,
-            html.Span(className='background dark',style={'background-image':'url("/static/valueback.jpg")'}),
+def slide6(snap):
+    volatility_summary = snap.volatility_summary
+    return html.Section(className='fullscreen bg-apple',children=[navbar,
+            html.Span(className='background dark',style={'background-image':'url("{}")'.format(asset_url('/static/valueback.jpg'))}),
             html.Div(className='wrap aligncenter',children=[
                 html.H2(html.Strong('Are cryptocurrencies a good store of value?')),
                 html.Hr(),
@@ -558,23 +841,21 @@ slide6 = html.Section(className='fullscreen bg-apple',children=[navbar,
                            html.A('Using data from 2013 to June 2018',href='https://www.kaggle.com/jessevent/all-crypto-currencies'),
                         ', we measured how volatile crypto prices are on a day-to-day basis -- comparing opening and closing prices.',
                         html.Br(),html.Br(),
-                        '''Combining all the market cap of cryptos, the biggest up swing in prices in a day was 44.35% (November 2013), while
-                           the biggest downswing was -24.25% (Dec 2013). For a rough comparison, the biggest upswing for the Dow Jones Industrial
-                           Average was 15.34% (1933), while the biggest downswing was −22.61% (1987).''',html.Br(),html.Br(),
+                        store_value_swings(volatility_summary),html.Br(),html.Br(),
                         '''For a more stark comparison, consider that the total value of crypto currencies went from $10B in May 2016 to $100B
                            in June 2017 to $800B in January 2018. And it now back to just over $100B in December 2018.''',html.Br(),html.Br(),
-                        '''If we focus only on the top 10 largest currencies, their volatility in prices is noticeable, with Ripple having the
-                           highest daily upswing in prices of 178.8% (April 2017) and Ethereum having the biggest daily drop of 73% (April 15).''']))
+                        store_value_extremes(volatility_summary)]))
         ])
     ])
 
 ## SLIDE 7: Store value Visualization
-slide7 = html.Section([navbar,storevalueviz])
+def slide7(snap):
+    return html.Section([navbar,storevalue_viz(snap)])
 
 ## SLIDE 8: Fast and Cheap Story
 slide8 = html.Section(className='bg-apple',children=[navbar,
             html.Div(className='wrap',children=[
-                html.Img(className='alignright size-40',src='/static/speedcost.svg'),
+                asset_img('/static/speedcost.svg',className='alignright size-40'),
                 html.H2(html.Strong('Fast and Cheap Transactions. Really?')),
                 html.P(['One of the premises of Bitcoin is to perform transactions quickly and with small fees. But how do those work',
                         ' in cryptocurrencies?',
@@ -595,10 +876,13 @@ slide8 = html.Section(className='bg-apple',children=[navbar,
     ])
 
 ## SLIDE 9: Fast and cheap Visualization
-slide9 = html.Section([navbar,fastcheapviz])
+def slide9(snap):
+    return html.Section([navbar,fastcheap_viz(snap)])
 
 ## SLIDE 10: Story Conclusion
-slide10 = html.Section(className='bg-apple',children=[navbar,
+def slide10(snap):
+    volatility_summary = snap.volatility_summary
+    return html.Section(className='bg-apple',children=[navbar,
             html.Div(className='wrap',children=[
                 html.H2(html.Strong('Conclusions')),
                 html.P('In summary, after looking at the data across the three key dimensions we reiterate below, we have some preliminary conclusions -- some pertinent only to Bitcoin, some to more currencies:'),
@@ -609,7 +893,7 @@ slide10 = html.Section(className='bg-apple',children=[navbar,
                     ]),
                     html.Li([
                         html.H2('Store of Value'),
-                        'Cryptocurrency prices are very volatile, with even top 10 cryptos swinging in price more than 100% in a given day. While they might be reasonably good speculative assets, their price instability make them a difficult store of value. This is exemplified by the fact that of crypto currencies went from $10B in May 2016 to $100B in June 2017 to $800B in January 2018. And it now back to just over $100B in December 2018.'
+                        store_value_conclusion(volatility_summary)
                     ]),
                     html.Li([
                         html.H2('Fast and Cheap Transactions'),
@@ -631,33 +915,71 @@ slide11 = html.Section(className='bg-apple',children=[navbar,
                 ]),
                 html.Div(className='wrap',children=[
                     html.Ul(className='flexblock gallery',children=[
-                        html.Li(html.A(html.Figure([html.Img(src='/static/arnobio.jpeg'),html.Figcaption([html.H2('Arnobio Morelix'),'Startup Genome'])]),href='https://www.linkedin.com/in/arnobiomorelix/')),
-                        html.Li(html.A(html.Figure([html.Img(src='/static/felipe.jpg'),html.Figcaption([html.H2('Felipe Campos'),'IBM'])]),href='https://www.linkedin.com/in/fneiva/')),
-                        html.Li(html.A(html.Figure([html.Img(src='/static/marcelo.jpeg'),html.Figcaption([html.H2('Marcelo Queiroz'),'ANDRITZ'])]),href='https://www.linkedin.com/in/marcelo-scatolin-queiroz-387a7020/'))
+                        html.Li(html.A(html.Figure([asset_img('/static/arnobio.jpeg',sizes='(max-width: 768px) 100vw, 33vw'),html.Figcaption([html.H2('Arnobio Morelix'),'Startup Genome'])]),href='https://www.linkedin.com/in/arnobiomorelix/')),
+                        html.Li(html.A(html.Figure([asset_img('/static/felipe.jpg',sizes='(max-width: 768px) 100vw, 33vw'),html.Figcaption([html.H2('Felipe Campos'),'IBM'])]),href='https://www.linkedin.com/in/fneiva/')),
+                        html.Li(html.A(html.Figure([asset_img('/static/marcelo.jpeg',sizes='(max-width: 768px) 100vw, 33vw'),html.Figcaption([html.H2('Marcelo Queiroz'),'ANDRITZ'])]),href='https://www.linkedin.com/in/marcelo-scatolin-queiroz-387a7020/'))
                     ])
                 ]),
         ])
 
-slides.append(slide1)
-slides.append(slide2)
-slides.append(slide3)
-slides.append(slide4)
-slides.append(slide5)
-slides.append(slide6)
-slides.append(slide7)
-slides.append(slide8)
-slides.append(slide9)
-slides.append(slide10)
-slides.append(slide11)
+# Slides 5, 6, 7, 9 and 10 show data, so they are built per snapshot
+def build_slides(snap):
+    slides = []
+    slides.append(slide1)
+    slides.append(slide2)
+    slides.append(slide3)
+    slides.append(slide4)
+    slides.append(slide5(snap))
+    slides.append(slide6(snap))
+    slides.append(slide7(snap))
+    slides.append(slide8)
+    slides.append(slide9(snap))
+    slides.append(slide10(snap))
+    slides.append(slide11)
+    return slides
 
 ####################################################
 ### 				DASH LAYOUT					 ###
 ####################################################
 
+def load_fields(bundle, previous=None):
+    fields = {}
+    fields.update(load_decentralized(bundle))
+    fields.update(load_storevalue_data(bundle, previous))
+    fields.update(load_fastcheap(bundle))
+    return fields
+
+# Built once per data and code version, then memory-mapped read-only by every
+# worker (see sharedstore.py)
+shared_fields = sharedstore.shared(load_fields, code_version)
+
+def load_data(bundle, previous=None):
+    return Snapshot(bundle, **shared_fields(bundle, previous))
+
 # Set the Dash layout using the slides designed above
-app.layout = html.Div([html.Main(role='main',children=[
-					   		html.Article(slides,id="webslides",className='vertical')]),
-					   gdc.Import(src="/static/renderWebSlides.js")])
+def build_layout(snap):
+    return html.Div([html.Main(role='main',children=[
+					   		html.Article(build_slides(snap),id="webslides",className='vertical')]),
+					   gdc.Import(src=asset_url("/static/renderWebSlides.js")),
+					   gdc.Import(src=asset_url("/static/fastCheapSync.js")),
+					   gdc.Import(src=asset_url("/static/lazySlides.js")),
+					   gdc.Import(src=asset_url("/static/treemapAnimation.js"))])
+
+# The layout is identical for every visitor, so it is serialized and
+# compressed once per snapshot instead of on every page load
+def publish_layout(snap):
+    app.layout = build_layout(snap)
+    serving.precompress_layout(app)
+
+data = Reloader(load_data)
+publish_layout(data.current)
+data.listeners.append(publish_layout)
+
+# Poll for new data from inside the worker that serves requests (threads
+# started before a fork do not survive it)
+@server.before_first_request
+def start_reloader():
+    data.start()
 
 ####################################################
 ### 			VISUALIZATION CALLBACKS			 ###
@@ -667,98 +989,215 @@ app.layout = html.Div([html.Main(role='main',children=[
 ##  Descentralized Callbacks  ##
 ################################
 
+# Switching granularity swaps in a slider with that granularity's marks,
+# keeping the slider on the snapshot nearest to where it was. On page load
+# the slider in the layout already has the selected granularity; replacing
+# it would only trigger both treemap callbacks a second time
 @app.callback(
+     Output('date_slider_container', 'children'),
+     [Input('treemap_granularity', 'value')],
+     [State('date_slider', 'value'),
+      State('date_slider', 'className')])
+def update_date_slider(granularity, date, rendered):
+    if granularity not in granularity_labels:
+        raise PreventUpdate()
+    if rendered == 'date-slider-' + granularity:
+        raise PreventUpdate()
+    return date_slider(data.current, granularity, date)
+
+
+@serving.bytes_callback(app,
      dash.dependencies.Output('vpm_treemap', 'figure'),
-     [dash.dependencies.Input('date_slider', 'value')])
-def update_vpm_treemap(date):
-    pos = bisect_left(unix_time_millis(df_val_per_month.index), date)
-    if pos == 0:
-        return build_treemap(unix_time_millis(df_val_per_month.index[0]),
-                             'values', tm_x, tm_y, tm_width, tm_height,'% of Total Volume')
-    if pos == len(df_val_per_month.index):
-        return build_treemap(unix_time_millis(df_val_per_month.index[-1]),
-                             'values', tm_x, tm_y, tm_width, tm_height,'% of Total Volume')
-    before = unix_time_millis(df_val_per_month.index[pos - 1])
-    after = unix_time_millis(df_val_per_month.index[pos])
-    if after - date < date - before:
-        return build_treemap(after,'values', tm_x, tm_y, tm_width, tm_height,'% of Total Volume')
-    else:
-        return build_treemap(before,'values', tm_x, tm_y, tm_width, tm_height,'% of Total Volume')
+     [dash.dependencies.Input('date_slider', 'value'),
+      dash.dependencies.Input('load_decentralized', 'value')],
+     [dash.dependencies.State('treemap_granularity', 'value')])
+def update_vpm_treemap(date, load, granularity):
+    if not load:
+        raise PreventUpdate()
+    return treemap_json(data.current, date, 'values', granularity)
 
 
-@app.callback(
+@serving.bytes_callback(app,
      dash.dependencies.Output('cpm_treemap', 'figure'),
-     [dash.dependencies.Input('date_slider', 'value')])
-def update_vpm_treemap(date):
-    cDate = timestamp_millis(date)
-    pos = bisect_left(df_ct_per_month.index, cDate)
-    if pos == 0:
-        return build_treemap(df_ct_per_month.index[0],
-                             'count', tm_x, tm_y, tm_width, tm_height,'% of Total Users')
-    if pos == len(df_ct_per_month.index):
-        return build_treemap(df_ct_per_month.index[-1],
-                             'count', tm_x, tm_y, tm_width, tm_height,'% of Total Users')
-    before = df_ct_per_month.index[pos - 1]
-    after = df_ct_per_month.index[pos]
-    if after - cDate < cDate - before:
-        return build_treemap(unix_time_millis(after),'count', tm_x,
-                             tm_y, tm_width, tm_height,'% of Total Users')
-    else:
-        return build_treemap(unix_time_millis(before),'count', tm_x,
-                             tm_y, tm_width, tm_height,'% of Total Users')
+     [dash.dependencies.Input('date_slider', 'value'),
+      dash.dependencies.Input('load_decentralized', 'value')],
+     [dash.dependencies.State('treemap_granularity', 'value')])
+def update_cpm_treemap(date, load, granularity):
+    if not load:
+        raise PreventUpdate()
+    return treemap_json(data.current, date, 'count', granularity)
 
 
 ################################
-## Fast and Cheap Callbacks   ##
+##   Store Value Callbacks    ##
 ################################
 
-@app.callback(
-    Output('fastandcheap', 'figure'),
-    [Input('start_date_input', 'value'),
-     Input('end_date_input', 'value')])
-def display_selected_data(start_date,end_date):
-	if (start_date == ''):
-		start_date = min_date
-	else:
-		start_date = parse(start_date).date()
-	if (end_date == ''):
-		end_date = max_date
-	else:
-		end_date = parse(end_date).date()
-	if ((start_date == str(min_date.date())) and (end_date == str(max_date.date()))):
-		return initial_figure
-	else:
-		return build_plots(initial_date=start_date,end_date=end_date,zoom=True)
+# Empty inputs stand for the full range. Dates still being typed (or otherwise
+# unparseable) leave the figure as it is
+def storevalue_window(snap, start, end):
+    start = start or str(snap.storevalue_min)
+    end = end or str(snap.storevalue_max)
+    try:
+        epoch_seconds(start), epoch_seconds(end)
+    except (ValueError, OverflowError):
+        raise PreventUpdate()
+    return start, end
+
+@serving.bytes_callback(app,
+    Output('change', 'figure'),
+    [Input('load_storevalue', 'value'),
+     Input('storevalue_coins', 'value'),
+     Input('storevalue_start', 'value'),
+     Input('storevalue_end', 'value')])
+def load_storevalue(load, coins, start, end):
+    if not load:
+        raise PreventUpdate()
+    snap = data.current
+    # Keep the legend in the store's order whatever order the coins were picked in
+    coins = tuple(i for i in snap.storevalue_coins if i in (coins or []))
+    start, end = storevalue_window(snap, start, end)
+    return figure_cache.get_or_build((code_version, snap.bundle.table_version('markets'), 'storevalue', coins, start, end),
+                                     lambda: build_storevalue(snap, coins, start, end))
+
+@serving.bytes_callback(app,
+    Output('correlation', 'figure'),
+    [Input('load_storevalue', 'value'),
+     Input('correlation_start', 'value'),
+     Input('correlation_end', 'value')])
+def load_correlation(load, start, end):
+    if not load:
+        raise PreventUpdate()
+    snap = data.current
+    start, end = storevalue_window(snap, start, end)
+    return figure_cache.get_or_build((code_version, snap.bundle.table_version('markets'), 'correlation', start, end),
+                                     lambda: build_correlation(snap, start, end))
 
-@app.callback(
-    Output('start_date_input', 'value'),
-    [Input('fastandcheap', 'relayoutData')])
-def zoom_to_start_date(relayoutData):
+
+################################
+## Fast and Cheap Callbacks   ##
+################################
+
+# A zoom or a typed date (synced in the browser by static/fastCheapSync.js)
+# arrives as one relayoutData change, so each gesture builds one figure. The
+# first full-range figure is requested by static/lazySlides.js the same way,
+# with an x-axis autorange
+def relayout_window(snap, relayoutData):
+    min_date, max_date = snap.min_date, snap.max_date
     if (relayoutData is None):
-        return min_date
-    if ('xaxis.range[0]' in relayoutData):
-        initial_date = parse(relayoutData['xaxis.range[0]'])
-        return initial_date.date()
+        return None
+    if (relayoutData.get('xaxis.autorange')):
+        return min_date.date(), max_date.date()
+    if ('xaxis.range[0]' in relayoutData) and ('xaxis.range[1]' in relayoutData):
+        bounds = [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']]
+    elif ('xaxis.range' in relayoutData):
+        bounds = relayoutData['xaxis.range']
     else:
-        return min_date
+        # Legend clicks, autosize and zooms on the right panel leave the time
+        # window alone
+        return None
+    start_date, end_date = sorted(parse(b).date() for b in bounds)
+    return max(start_date, min_date.date()), min(end_date, max_date.date())
+
+def plots_json(snap, start_date, end_date):
+    # The background image URL changes with the asset build
+    key = (code_version, snap.bundle.table_version('fees', 'times'), static_assets.version, 'plots',
+           str(start_date), str(end_date))
+    if ((start_date == snap.min_date.date()) and (end_date == snap.max_date.date())):
+        return figure_cache.get_or_build(key, lambda: build_plots(snap))
+    else:
+        return figure_cache.get_or_build(key, lambda: build_plots(snap,initial_date=start_date,end_date=end_date,zoom=True))
 
-@app.callback(
-    Output('end_date_input', 'value'),
+@serving.bytes_callback(app,
+    Output('fastandcheap', 'figure'),
     [Input('fastandcheap', 'relayoutData')])
-def zoom_to_end_date(relayoutData):
-    if (relayoutData is None):
-        return max_date
-    if ('xaxis.range[1]' in relayoutData):
-        end_date = parse(relayoutData['xaxis.range[1]'])
-        return end_date.date()
-    else:
-        return max_date
+def display_selected_data(relayoutData):
+    snap = data.current
+    window = relayout_window(snap, relayoutData)
+    if (window is None):
+        raise PreventUpdate()
+    start_date, end_date = window
+    return plots_json(snap, start_date, end_date)
+
+
+################################
+##       Cache Warm-up        ##
+################################
+
+# Built in the background once a worker starts serving and after every data
+# reload (see warmup.py): the full-range Fast and Cheap figure, the popular
+# windows below and every treemap snapshot of the listed granularities, newest
+# first since the slider starts at the end. CACHE_WARMUP_WINDOWS overrides the windows as
+# comma-separated start:end pairs; malformed pairs are skipped
+def parse_warmup_windows(spec):
+    windows = []
+    for pair in spec.split(','):
+        if not pair:
+            continue
+        bounds = pair.split(':')
+        try:
+            if len(bounds) != 2:
+                raise ValueError('expected start:end')
+            for bound in bounds:
+                parse(bound)
+        except (ValueError, OverflowError) as e:
+            print('Ignoring CACHE_WARMUP_WINDOWS entry {!r}: {}'.format(pair, e), file=sys.stderr)
+            continue
+        windows.append(bounds)
+    return windows
+
+warmup_windows = parse_warmup_windows(os.environ.get(
+    'CACHE_WARMUP_WINDOWS', '2017-01-01:2017-12-31,2017-10-01:2018-03-31,2018-01-01:2018-12-31'))
+warmup_granularities = os.environ.get('CACHE_WARMUP_GRANULARITIES', 'month').split(',')
+
+def warmup_tasks(snap):
+    windows = [{'xaxis.autorange': True}] + [{'xaxis.range': bounds} for bounds in warmup_windows]
+    for relayoutData in windows:
+        # Through relayout_window, so the keys match the callback's
+        window = relayout_window(snap, relayoutData)
+        yield lambda window=window: plots_json(snap, *window)
+    for granularity in warmup_granularities:
+        if granularity not in granularity_labels:
+            continue
+        for epoch in snap.treemaps[(granularity, 'count')].index.epochs[::-1]:
+            for dataset in treemap_titles:
+                yield lambda epoch=int(epoch), dataset=dataset, granularity=granularity: \
+                    treemap_json(snap, epoch, dataset, granularity)
+
+warmer = warmup.CacheWarmer(warmup_tasks)
+data.listeners.append(warmer.warm)
+
+# Started from the first request of each worker, never at import: with
+# gunicorn --preload the import runs in the master, and a thread building
+# figures there could hold a cache lock across the fork and hang the worker
+@server.before_request
+def start_warmup():
+    warmer.start(data.current)
+
+
+################################
+##          Metrics           ##
+################################
+
+# Latency, response sizes and errors of every callback above, and the cache
+# hit ratios, in the Prometheus text format at /_metrics
+callback_metrics = metrics.CallbackMetrics()
+callback_metrics.instrument(app)
+callback_metrics.watch_cache('figures', figure_cache)
+callback_metrics.watch_cache('treemap_frames', frame_payloads)
+callback_metrics.serve(server)
 
 
 ####################################################
 ### 			DASH INITIALIZATION				 ###
 ####################################################
 
+# The Procfile runs gunicorn with --preload, so workers are forked from the
+# process that ran everything above. Moving the objects allocated so far out
+# of the collector's reach (Python 3.7+) keeps collections in the workers from
+# writing to them and so copying the pages they share with the master
+if hasattr(gc, 'freeze'):
+    gc.freeze()
+
 # Fire up the Dash Server
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,307 @@
+####################################################
+###             COLUMNAR DATA BUNDLE             ###
+####################################################
+
+# The app used to parse every CSV with pandas at import time. This module
+# compiles them once into a versioned bundle of typed .npy columns (int64
+# epoch dates, float32 values, integer codes for the categorical columns)
+# that the app memory-maps at startup instead.
+#
+# Build it with:
+#
+#     python datastore.py
+#
+# If the bundle is missing or older than the CSVs, load_bundle() compiles it
+# on the spot, so a fresh checkout still boots.
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import contextlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_DIR = os.path.join(BASE_DIR, '.bundle')
+
+# Bump whenever the on-disk layout or the compiled contents change
+FORMAT_VERSION = 3
+
+BIN_COLUMNS = ["Planktons", "Clownfishes", "Lionfishes", "Swordfishes",
+               "Sharks", "Whales"]
+
+SOURCES = OrderedDict([
+    ('fees', 'avg_transaction_fee.csv'),
+    ('times', 'block_times.csv'),
+    ('val_per_month', 'change_bins_values_per_month.csv'),
+    ('ct_per_month', 'change_count_bins_per_month.csv'),
+    ('val_per_week', 'change_bins_values_per_week.csv'),
+    ('ct_per_week', 'change_count_bins_per_week.csv'),
+    ('markets', 'crypto10-markets-am.csv'),
+])
+
+MARKET_CATEGORIES = ['slug', 'symbol', 'name']
+
+
+def to_epoch(dates):
+    # datetime64 values (or anything pandas can parse) -> int64 epoch seconds
+    values = pd.to_datetime(dates).values.astype('datetime64[s]')
+    return values.astype(np.int64)
+
+
+################################
+##       Atomic writes        ##
+################################
+
+# Everything the app writes for other processes to read (bundles, shared
+# fields, cached figures, static builds, the CSVs) is written next to its
+# final name and renamed into place, so a reader sees the old contents or the
+# new ones, never a partial write.
+
+@contextlib.contextmanager
+def atomic_write(path, mode=None):
+    """Binary file object that replaces path when the block exits cleanly;
+    on an error the temp file is removed and path is left alone. mode sets
+    the permission bits, by default those of the file replaced (0o644 for a
+    new one)."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        if mode is None:
+            mode = os.stat(path).st_mode & 0o7777 if os.path.exists(path) else 0o644
+        os.chmod(tmp, mode)
+        os.rename(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@contextlib.contextmanager
+def atomic_directory(target):
+    """Scratch directory next to target, renamed to target when the block
+    exits cleanly and removed on an error. If another process renamed its
+    own build into place first, that one is kept: builds of the same target
+    are identical."""
+    tmp = tempfile.mkdtemp(prefix='.build-', dir=os.path.dirname(target))
+    try:
+        yield tmp
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(target):
+            raise
+
+
+################################
+##         Compilers          ##
+################################
+
+def _compile_daily(path):
+    df = pd.read_csv(path)
+    df = df.sort_values(by='date')
+    columns = OrderedDict()
+    columns['date'] = to_epoch(pd.to_datetime(df['date'], format='%Y/%m/%d'))
+    for coin in df.columns:
+        if coin != 'date':
+            columns[coin] = df[coin].values.astype(np.float32)
+    return columns, {}, ['date']
+
+
+def _compile_bins(path):
+    # Bins are stored as the percentage of each row's total, which is what
+    # the treemaps display
+    df = pd.read_csv(path)
+    df = df.sort_values(by='day')
+    bins = df[df.columns[1:]].fillna(0).values.astype(np.float64)
+    totals = bins.sum(axis=1)
+    totals[totals == 0] = 1
+    pct = bins / totals[:, None] * 100
+    columns = OrderedDict()
+    columns['Month'] = to_epoch(df['day'])
+    for i, name in enumerate(BIN_COLUMNS):
+        columns[name] = pct[:, i].astype(np.float32)
+    return columns, {}, ['Month']
+
+
+def _compile_markets(path):
+    # Rows are sorted by (coin, date) so the app can slice one coin's rows
+    # straight out of the memory-mapped columns (see markets.py)
+    df = pd.read_csv(path, index_col=0)
+    codes = OrderedDict()
+    categories = {}
+    for col in MARKET_CATEGORIES:
+        codes[col], uniques = pd.factorize(df[col])
+        categories[col] = [str(u) for u in uniques]
+    order = np.lexsort((pd.to_datetime(df['date']).values, codes['name']))
+    df = df.iloc[order]
+    columns = OrderedDict()
+    for col in df.columns:
+        if col in MARKET_CATEGORIES:
+            columns[col] = codes[col][order].astype(np.int16)
+        elif col == 'date':
+            columns[col] = to_epoch(df[col])
+        elif col == 'ranknow':
+            columns[col] = df[col].values.astype(np.int32)
+        else:
+            columns[col] = df[col].values.astype(np.float32)
+    return columns, categories, ['date']
+
+
+# Each returns (columns, categories, names of the epoch-second date columns)
+COMPILERS = {
+    'fees': _compile_daily,
+    'times': _compile_daily,
+    'val_per_month': _compile_bins,
+    'ct_per_month': _compile_bins,
+    'val_per_week': _compile_bins,
+    'ct_per_week': _compile_bins,
+    'markets': _compile_markets,
+}
+
+
+################################
+##     Versioning & Build     ##
+################################
+
+def source_digests(src_dir=BASE_DIR):
+    digests = OrderedDict()
+    for table, filename in SOURCES.items():
+        with open(os.path.join(src_dir, filename), 'rb') as f:
+            digests[table] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+
+def data_version(digests):
+    h = hashlib.sha1(str(FORMAT_VERSION).encode())
+    for table in digests:
+        h.update(table.encode())
+        h.update(digests[table].encode())
+    return 'v{}-{}'.format(FORMAT_VERSION, h.hexdigest()[:12])
+
+
+def compile_bundle(src_dir=BASE_DIR, bundle_dir=BUNDLE_DIR):
+    """Compile every CSV in SOURCES into a new bundle version and return its path."""
+    digests = source_digests(src_dir)
+    version = data_version(digests)
+    target = os.path.join(bundle_dir, version)
+    if os.path.exists(os.path.join(target, 'manifest.json')):
+        return target
+
+    if not os.path.isdir(bundle_dir):
+        os.makedirs(bundle_dir)
+    # Build into a scratch directory and rename it into place, so concurrent
+    # workers never see a half-written bundle
+    manifest = {'format': FORMAT_VERSION, 'version': version,
+                'sources': digests, 'tables': OrderedDict()}
+    with atomic_directory(target) as tmp:
+        for table, filename in SOURCES.items():
+            columns, categories, dates = COMPILERS[table](os.path.join(src_dir, filename))
+            os.makedirs(os.path.join(tmp, table))
+            for i, (name, values) in enumerate(columns.items()):
+                np.save(os.path.join(tmp, table, '{:02d}.npy'.format(i)),
+                        np.ascontiguousarray(values))
+            manifest['tables'][table] = {
+                'rows': int(len(next(iter(columns.values())))),
+                'columns': list(columns.keys()),
+                'categories': categories,
+                # Epoch-second columns that frame() decodes as dates
+                'dates': dates,
+            }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return target
+
+
+def prune_bundles(keep, bundle_dir=BUNDLE_DIR):
+    """Delete the bundle versions compiled before the one at keep (with their
+    shared fields). Processes still mapping their files keep their mappings;
+    versions compiled after it, e.g. by another worker, are left alone."""
+    try:
+        newest = os.stat(keep).st_mtime
+        names = os.listdir(bundle_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(bundle_dir, name)
+        if name.startswith('.build-') or os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            if os.path.isdir(path) and os.stat(path).st_mtime <= newest:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+################################
+##          Loading           ##
+################################
+
+class Bundle(object):
+    """Read-only view over a compiled bundle; columns are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f, object_pairs_hook=OrderedDict)
+        self.version = self.manifest['version']
+        self._columns = {}
+
+    def columns(self, table):
+        if table not in self._columns:
+            info = self.manifest['tables'][table]
+            cols = OrderedDict()
+            for i, name in enumerate(info['columns']):
+                cols[name] = np.load(os.path.join(self.path, table, '{:02d}.npy'.format(i)),
+                                     mmap_mode='r')
+            self._columns[table] = cols
+        return self._columns[table]
+
+    def table_version(self, *tables):
+        """Version of just the given tables, for keys that should survive
+        updates to the other sources."""
+        sources = self.manifest['sources']
+        return data_version(OrderedDict((t, sources[t]) for t in tables))
+
+    def categories(self, table, column):
+        return self.manifest['tables'][table]['categories'][column]
+
+    def frame(self, table, index=None):
+        """Build a DataFrame for a table, decoding dates and categoricals."""
+        info = self.manifest['tables'][table]
+        data = OrderedDict()
+        for name, values in self.columns(table).items():
+            if name in info['categories']:
+                data[name] = pd.Categorical.from_codes(values, info['categories'][name])
+            elif name in info['dates']:
+                # Epoch seconds reinterpreted, no per-value parsing
+                data[name] = values.astype('datetime64[s]').astype('datetime64[ns]')
+            else:
+                data[name] = values
+        df = pd.DataFrame(data, columns=list(data.keys()))
+        if index is not None:
+            df = df.set_index(index)
+        return df
+
+
+def load_bundle(src_dir=BASE_DIR, bundle_dir=BUNDLE_DIR):
+    """Open the bundle matching the current CSVs, compiling it if needed."""
+    return Bundle(compile_bundle(src_dir, bundle_dir))
+
+
+if __name__ == '__main__':
+    src = sys.argv[1] if len(sys.argv) > 1 else BASE_DIR
+    path = compile_bundle(src)
+    print('Bundle ready at {}'.format(path))
@@ -0,0 +1,192 @@
+####################################################
+###            SERIALIZED FIGURE CACHE           ###
+####################################################
+
+# Figures are cached already serialized to JSON bytes, so a cache hit costs a
+# dictionary lookup instead of a Plotly object build plus a json.dumps.
+#
+# Two tiers: a per-process LRU in front of a directory on local disk that all
+# gunicorn workers share and that survives restarts. Keys should include the
+# data version and the code version, so neither a new bundle nor a deploy
+# that changes a figure builder ever serves stale figures.
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import plotly
+
+import datastore
+
+
+def to_json_bytes(figure):
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+
+
+class LRUCache(object):
+    """Thread-safe bounded LRU mapping keys to serialized figures. With
+    max_bytes set, the total len() of the values is bounded too."""
+
+    def __init__(self, maxsize=1024, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return 0 if self.max_bytes is None else len(value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._data[key] = value
+            self.bytes += self._size(value)
+            while self._data and (len(self._data) > self.maxsize or
+                                  (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self.bytes -= self._size(self._data.popitem(last=False)[1])
+
+    def get_or_build(self, key, build):
+        """Return the cached bytes for key, serializing build() on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = to_json_bytes(build())
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+
+class DiskCache(object):
+    """Serialized figures as files in a shared directory, evicting the least
+    recently used files once the directory grows past max_bytes."""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, check_every=50):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                pass
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        filename = self._file(key)
+        try:
+            with open(filename, 'rb') as f:
+                value = f.read()
+        except (IOError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        try:
+            # Reads refresh the mtime, which is what eviction orders by
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        # Write to a temp file and rename, so readers in other workers never
+        # see a partial figure
+        try:
+            with datastore.atomic_write(self._file(key)) as f:
+                f.write(value)
+        except (IOError, OSError):
+            return
+        with self._lock:
+            self._writes += 1
+            check = self._writes % self.check_every == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class TwoTierCache(object):
+    """In-process LRU backed by a shared DiskCache."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def tiers(self):
+        """(name, cache) of each tier, for hit and miss counts."""
+        return [(name, tier) for name, tier in (('memory', self.memory), ('disk', self.disk))
+                if tier is not None]
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def get_or_build(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = to_json_bytes(build())
+            self.put(key, value)
+        return value
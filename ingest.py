@@ -0,0 +1,101 @@
+####################################################
+###            APPEND-ONLY INGESTION             ###
+####################################################
+
+# Adds newly scraped days to the daily BitInfoCharts CSVs
+# (avg_transaction_fee.csv, block_times.csv) instead of rewriting them. Only
+# dates after the last one already stored are appended, so history never
+# changes and the running app (see snapshot.py) picks the new rows up on its
+# next check.
+#
+#     python ingest.py fees new_fees.csv
+#     python ingest.py times new_block_times.csv
+
+import os
+import sys
+import shutil
+
+import pandas as pd
+
+import datastore
+
+DAILY_TABLES = ['fees', 'times']
+DATE_FORMAT = '%Y/%m/%d'
+
+
+def _last_line(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        chunk = b''
+        while pos > 0 and chunk.rstrip(b'\n').count(b'\n') < 1:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + chunk
+        return chunk.rstrip(b'\n').split(b'\n')[-1].decode('utf-8')
+
+
+def last_date(table, src_dir=datastore.BASE_DIR):
+    """Last date stored in a daily CSV, read from the end of the file."""
+    path = os.path.join(src_dir, datastore.SOURCES[table])
+    return pd.to_datetime(_last_line(path).split(',')[0], format=DATE_FORMAT)
+
+
+def _write_widened(f, out, added):
+    # Copy of the CSV in f with the added columns at the end of every line
+    out.write(f.readline().rstrip(b'\r\n') + ',{}\n'.format(','.join(added)).encode('utf-8'))
+    padding = b',' * len(added) + b'\n'
+    for line in f:
+        line = line.rstrip(b'\r\n')
+        if line:
+            out.write(line + padding)
+
+
+def append_daily(table, frame, src_dir=datastore.BASE_DIR):
+    """Append the rows of frame dated after the CSV's last date.
+
+    frame has one column per coin and the dates either as its index or in a
+    'date' column, like the DataFrames built in BitInfoChartScraper.ipynb.
+    Columns the CSV does not have yet are added to it, which rewrites the
+    file once. Returns the number of rows appended.
+    """
+    if table not in DAILY_TABLES:
+        raise ValueError('{} is not a daily table'.format(table))
+    path = os.path.join(src_dir, datastore.SOURCES[table])
+    with open(path) as f:
+        header = f.readline().strip().split(',')
+
+    if 'date' in frame.columns:
+        frame = frame.set_index('date')
+    frame = frame.copy()
+    frame.index = pd.to_datetime(frame.index)
+    frame = frame[frame.index > last_date(table, src_dir)].sort_index()
+    if len(frame) == 0:
+        return 0
+    # A coin the CSV has no column for yet (e.g. newly registered in
+    # coins.py) widens the header, with empty values on the existing rows
+    added = [c for c in frame.columns if c not in header[1:]]
+    frame = frame.reindex(columns=header[1:] + added)
+    frame.index = frame.index.strftime(DATE_FORMAT)
+
+    # Write the grown file next to the old one and rename it over it, so a
+    # reader never sees a half-appended row
+    with datastore.atomic_write(path) as out:
+        with open(path, 'rb') as f:
+            if added:
+                _write_widened(f, out, added)
+            else:
+                shutil.copyfileobj(f, out)
+                f.seek(max(0, f.tell() - 1))
+                if f.read(1) not in (b'', b'\n'):
+                    out.write(b'\n')
+        out.write(frame.to_csv(header=False).encode('utf-8'))
+    return len(frame)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in DAILY_TABLES:
+        sys.exit('usage: python ingest.py {fees,times} NEW_ROWS.csv')
+    rows = append_daily(sys.argv[1], pd.read_csv(sys.argv[2]))
+    print('Appended {} rows to {}'.format(rows, datastore.SOURCES[sys.argv[1]]))
@@ -0,0 +1,64 @@
+####################################################
+###          COIN-PARTITIONED MARKET STORE       ###
+####################################################
+
+# Market rows sorted by (coin, date) once, with per-coin offset ranges. Getting
+# one coin's rows, or a date window of them, is two binary searches and a
+# slice that shares memory with the (memory-mapped) columns: no per-coin
+# scans of the whole table, so the cost per coin does not grow with the
+# number of coins.
+
+from collections import OrderedDict
+
+import numpy as np
+
+from timeindex import epoch_seconds
+
+
+def _is_sorted(codes, dates):
+    dc = np.diff(codes)
+    return bool(np.all((dc > 0) | ((dc == 0) & (np.diff(dates) >= 0))))
+
+
+class MarketStore(object):
+
+    def __init__(self, columns, names, key='name'):
+        # columns: {column: array} with integer codes in columns[key] and
+        # epoch seconds in columns['date']; names: the coin name of each code
+        codes = columns[key]
+        dates = columns['date']
+        if not _is_sorted(codes, dates):
+            order = np.lexsort((dates, codes))
+            columns = OrderedDict((k, np.asarray(v)[order]) for k, v in columns.items())
+            codes = columns[key]
+        self.columns = columns
+        bounds = np.searchsorted(codes, np.arange(len(names) + 1), side='left')
+        self.offsets = OrderedDict()
+        for i, name in enumerate(names):
+            if bounds[i + 1] > bounds[i]:
+                self.offsets[name] = (int(bounds[i]), int(bounds[i + 1]))
+
+    @classmethod
+    def from_bundle(cls, bundle, table='markets', key='name'):
+        return cls(bundle.columns(table), bundle.categories(table, key), key)
+
+    def coins(self):
+        return list(self.offsets.keys())
+
+    def date_bounds(self):
+        dates = self.columns['date']
+        return int(dates.min()), int(dates.max())
+
+    def range(self, name, start=None, end=None):
+        """Row positions [lo, hi) of one coin's rows with start <= date <= end."""
+        lo, hi = self.offsets[name]
+        dates = self.columns['date'][lo:hi]
+        first = 0 if start is None else int(np.searchsorted(dates, epoch_seconds(start), side='left'))
+        last = len(dates) if end is None else int(np.searchsorted(dates, epoch_seconds(end), side='right'))
+        return lo + first, lo + max(first, last)
+
+    def slice(self, name, start=None, end=None, columns=None):
+        """Views of a coin's columns over a date window."""
+        lo, hi = self.range(name, start, end)
+        names = columns if columns is not None else list(self.columns.keys())
+        return OrderedDict((c, self.columns[c][lo:hi]) for c in names)
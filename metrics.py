@@ -0,0 +1,180 @@
+####################################################
+###              CALLBACK METRICS                ###
+####################################################
+
+# Per-callback latency, response size, call and error counts, plus the hit
+# counts of the figure caches, served in the Prometheus text format:
+#
+#     metrics = CallbackMetrics()
+#     metrics.instrument(app)          # after every callback is registered
+#     metrics.watch_cache('figures', figure_cache)
+#     metrics.serve(server)            # GET /_metrics
+#
+# Counts are kept per process. Under gunicorn each scrape hits one worker;
+# the pid label keeps the workers' series apart so rates stay meaningful.
+
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+import flask
+from dash.exceptions import PreventUpdate
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Serialized response bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """Bucketed observations; not locked, the owner serializes access."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield sample(name + '_bucket', labels + [('le', bound)], cumulative)
+        yield sample(name + '_sum', labels, self.sum)
+        yield sample(name + '_count', labels, self.count)
+
+
+class CallbackStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prevented = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+
+def sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(k, format_value(v).replace('\\', '\\\\').replace('"', '\\"'))
+                               for k, v in labels) + '}'
+    return '{} {}'.format(name, format_value(value))
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class CallbackMetrics(object):
+
+    def __init__(self):
+        self.callbacks = OrderedDict()
+        self.caches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def instrument(self, app):
+        """Time every callback registered on app so far."""
+        for callback_id, entry in app.callback_map.items():
+            if callback_id not in self.callbacks:
+                self.callbacks[callback_id] = CallbackStats()
+                entry['callback'] = self._wrap(callback_id, entry['callback'])
+
+    def _wrap(self, callback_id, callback):
+        stats = self.callbacks[callback_id]
+
+        def timed(*args):
+            start = time.perf_counter()
+            outcome = None
+            try:
+                response = callback(*args)
+            except PreventUpdate:
+                outcome = 'prevented'
+                raise
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                with self._lock:
+                    stats.calls += 1
+                    stats.latency.observe(seconds)
+                    if outcome == 'prevented':
+                        stats.prevented += 1
+                    elif outcome == 'error':
+                        stats.errors += 1
+            # Dash callbacks answer with a flask.Response holding the
+            # serialized output
+            size = len(response.get_data()) if isinstance(response, flask.Response) else len(str(response))
+            with self._lock:
+                stats.size.observe(size)
+            return response
+
+        return timed
+
+    def watch_cache(self, name, cache):
+        """Report hits and misses of a figcache cache (or each tier of a
+        TwoTierCache)."""
+        self.caches[name] = cache
+
+    def render(self):
+        pid = [('pid', os.getpid())]
+        lines = []
+
+        def family(name, kind, text):
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+        with self._lock:
+            callbacks = list(self.callbacks.items())
+            family('dash_callback_calls_total', 'counter', 'Callback invocations.')
+            lines.extend(sample('dash_callback_calls_total', pid + [('callback', c)], s.calls)
+                         for c, s in callbacks)
+            family('dash_callback_errors_total', 'counter', 'Callback invocations that raised an error.')
+            lines.extend(sample('dash_callback_errors_total', pid + [('callback', c)], s.errors)
+                         for c, s in callbacks)
+            family('dash_callback_prevented_total', 'counter', 'Callback invocations that raised PreventUpdate.')
+            lines.extend(sample('dash_callback_prevented_total', pid + [('callback', c)], s.prevented)
+                         for c, s in callbacks)
+            family('dash_callback_duration_seconds', 'histogram', 'Callback latency, serialization included.')
+            for c, s in callbacks:
+                lines.extend(s.latency.lines('dash_callback_duration_seconds', pid + [('callback', c)]))
+            family('dash_callback_response_bytes', 'histogram', 'Serialized callback response size.')
+            for c, s in callbacks:
+                lines.extend(s.size.lines('dash_callback_response_bytes', pid + [('callback', c)]))
+
+        tiers = []
+        for name, cache in self.caches.items():
+            for tier, counted in (cache.tiers() if hasattr(cache, 'tiers') else [('memory', cache)]):
+                tiers.append((name, tier, counted.hits, counted.misses))
+        family('cache_hits_total', 'counter', 'Cache lookups that found an entry.')
+        lines.extend(sample('cache_hits_total', pid + [('cache', n), ('tier', t)], h)
+                     for n, t, h, m in tiers)
+        family('cache_misses_total', 'counter', 'Cache lookups that found nothing.')
+        lines.extend(sample('cache_misses_total', pid + [('cache', n), ('tier', t)], m)
+                     for n, t, h, m in tiers)
+        family('cache_hit_ratio', 'gauge', 'Share of lookups served from the cache since start.')
+        for name in self.caches:
+            # Lookups reach the later tiers only on a miss in the first one
+            lookups = [(h, m) for n, t, h, m in tiers if n == name]
+            total = lookups[0][0] + lookups[0][1]
+            hits = sum(h for h, m in lookups)
+            lines.append(sample('cache_hit_ratio', pid + [('cache', name)],
+                                float(hits) / total if total else 0.0))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, server, path='/_metrics'):
+        def metrics_endpoint():
+            return flask.Response(self.render(), content_type=CONTENT_TYPE,
+                                  headers={'Cache-Control': 'no-store'})
+        server.add_url_rule(path, 'metrics', metrics_endpoint)
@@ -0,0 +1,106 @@
+####################################################
+###         MULTI-RESOLUTION AGGREGATES          ###
+####################################################
+
+# Daily, weekly and monthly pre-aggregated levels (mean, min, max and count
+# per bucket) of a dated table, built once. A request picks the coarsest level
+# that still has enough buckets in its date window, so full-history views come
+# from the monthly level, deep zooms from the daily one, and the number of
+# points sent stays roughly the same whatever the span.
+
+from collections import OrderedDict
+
+import numpy as np
+
+from timeindex import TimeIndex, epoch_seconds
+
+DAY = 86400
+
+
+def _floor_day(epochs):
+    return epochs - epochs % DAY
+
+
+def _floor_week(epochs):
+    # Weeks start on Monday; 1970-01-01 was a Thursday
+    days = epochs // DAY
+    return (days - (days + 3) % 7) * DAY
+
+
+def _floor_month(epochs):
+    months = epochs.astype('datetime64[s]').astype('datetime64[M]')
+    return months.astype('datetime64[s]').astype(np.int64)
+
+
+LEVELS = OrderedDict([
+    ('daily', _floor_day),
+    ('weekly', _floor_week),
+    ('monthly', _floor_month),
+])
+
+
+class Level(object):
+    """One resolution: bucket start dates plus (buckets x columns) stats."""
+
+    def __init__(self, name, floor, epochs, values, names):
+        self.name = name
+        self.floor = floor
+        self.names = names
+        self.columns = dict((n, i) for i, n in enumerate(names))
+
+        starts = floor(epochs)
+        first = np.flatnonzero(np.concatenate([[True], starts[1:] != starts[:-1]]))
+        valid = ~np.isnan(values)
+        self.index = TimeIndex(starts[first])
+        self.count = np.add.reduceat(valid.astype(np.int64), first, axis=0)
+        total = np.add.reduceat(np.where(valid, values, 0.0), first, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(self.count > 0, total / self.count, np.nan)
+        # fmin/fmax skip NaNs unless the whole bucket is empty
+        self.min = np.fmin.reduceat(values, first, axis=0)
+        self.max = np.fmax.reduceat(values, first, axis=0)
+
+    def __len__(self):
+        return len(self.index)
+
+    def range(self, start=None, end=None):
+        """Positions of the buckets overlapping start..end."""
+        if start is not None:
+            start = int(self.floor(np.array([epoch_seconds(start)]))[0])
+        return self.index.range(start, end)
+
+
+class Pyramid(object):
+
+    def __init__(self, index, columns):
+        # index: TimeIndex over the daily rows; columns: ordered {name: values}
+        names = list(columns.keys())
+        values = np.column_stack([np.asarray(columns[n], dtype=np.float64) for n in names])
+        self.levels = [Level(name, floor, index.epochs, values, names)
+                       for name, floor in LEVELS.items()]
+
+    @classmethod
+    def from_frame(cls, index, df, names):
+        return cls(index, OrderedDict((n, df[n].values) for n in names))
+
+    def select(self, start=None, end=None, min_points=60):
+        """Coarsest level with at least min_points buckets in the window."""
+        for level in reversed(self.levels):
+            lo, hi = level.range(start, end)
+            if hi - lo >= min_points:
+                return level
+        return self.levels[0]
+
+    def window(self, start=None, end=None, min_points=60):
+        """Every column over a window at once: a dict with the bucket dates
+        as ISO day strings, the (buckets x columns) means and, for
+        aggregated levels, the min/max error bars around them."""
+        level = self.select(start, end, min_points)
+        lo, hi = level.range(start, end)
+        days = level.index.epochs[lo:hi].astype('datetime64[s]').astype('datetime64[D]')
+        mean = level.mean[lo:hi]
+        block = {'daily': level is self.levels[0], 'x': np.datetime_as_string(days), 'y': mean}
+        if not block['daily']:
+            block['plus'] = level.max[lo:hi] - mean
+            block['minus'] = mean - level.min[lo:hi]
+        return block
@@ -0,0 +1,39 @@
+####################################################
+###             PREFIX-SUM RANGE MEANS           ###
+####################################################
+
+# NaN-aware prefix sums and prefix counts for every column of a dated table,
+# stacked into one 2-D array. The mean of any date window is two binary
+# searches plus one subtraction per column, whatever the history length.
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RangeMeans(object):
+
+    def __init__(self, index, columns):
+        # index: TimeIndex over the table rows; columns: ordered {name: values}
+        self.index = index
+        self.names = list(columns.keys())
+        values = np.column_stack([np.asarray(columns[n], dtype=np.float64) for n in self.names])
+        valid = ~np.isnan(values)
+        zero = np.zeros((1, len(self.names)))
+        self.sums = np.vstack([zero, np.cumsum(np.where(valid, values, 0.0), axis=0)])
+        self.counts = np.vstack([zero, np.cumsum(valid, axis=0)])
+
+    @classmethod
+    def from_frame(cls, index, df, names):
+        return cls(index, OrderedDict((n, df[n].values) for n in names))
+
+    def mean_array(self, start=None, end=None):
+        """Means of every column over start <= date <= end (NaN where empty)."""
+        lo, hi = self.index.range(start, end)
+        total = self.sums[hi] - self.sums[lo]
+        count = self.counts[hi] - self.counts[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    def means(self, start=None, end=None):
+        return dict(zip(self.names, self.mean_array(start, end)))
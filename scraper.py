@@ -0,0 +1,288 @@
+####################################################
+###            BITINFOCHARTS SCRAPER             ###
+####################################################
+
+# The fetching half of BitInfoChartScraper.ipynb as a module. All pages are
+# downloaded concurrently by a bounded thread pool sharing one pooled
+# requests session, with a timeout, retries with exponential backoff and a
+# minimum spacing between requests to the same host. A full refresh takes
+# about as long as the slowest page instead of the sum of all of them.
+#
+#     python scraper.py                     # scrape and append new days
+#     python scraper.py --dry-run           # scrape and print a summary
+#     python scraper.py --save-pages pages  # also keep the raw pages
+#
+# --base-url points it somewhere else than bitinfocharts.com, e.g. a local
+# server over pages saved with --save-pages:
+#
+#     (cd pages && python -m http.server 8000)
+#     python scraper.py --base-url http://localhost:8000 --dry-run
+
+import os
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit, unquote
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import as_strided
+
+import ingest
+from coins import KNOWN_COINS
+
+BASE_URL = os.environ.get('BITINFOCHARTS_URL', 'https://bitinfocharts.com')
+
+# Page paths per table and coin, relative to the base URL, for every coin of
+# the registry that has a BitInfoCharts page
+PAGE_SUFFIXES = OrderedDict([('fees', 'transactionfees'), ('times', 'confirmationtime')])
+PAGES = OrderedDict(
+    (table, OrderedDict((coin.symbol, '/comparison/{}-{}.html'.format(coin.page, suffix))
+                        for coin in KNOWN_COINS if coin.page))
+    for table, suffix in PAGE_SUFFIXES.items())
+
+# Enough threads for every page at once
+WORKERS = 14
+TIMEOUT = 30
+RETRIES = 4
+BACKOFF = 0.5
+# Minimum seconds between the starts of two requests to the same host
+HOST_INTERVAL = 0.1
+
+
+################################
+##          Fetching          ##
+################################
+
+class HostRateLimiter(object):
+    """Spaces out requests to each host by at least `interval` seconds."""
+
+    def __init__(self, interval=HOST_INTERVAL):
+        self.interval = interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(workers=WORKERS, retries=RETRIES, backoff=BACKOFF):
+    """A requests session whose connection pool fits `workers` threads and
+    that retries connection errors and 429/5xx answers with exponential
+    backoff."""
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch(session, limiter, url, timeout=TIMEOUT):
+    limiter.wait(url)
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def fetch_pages(urls, workers=WORKERS, session=None, limiter=None, timeout=TIMEOUT):
+    """Download every URL in the {key: url} mapping concurrently and return
+    {key: page bytes} in the same order. The first failure is raised."""
+    session = session if session is not None else make_session(workers)
+    limiter = limiter if limiter is not None else HostRateLimiter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = OrderedDict((key, pool.submit(fetch, session, limiter, url, timeout))
+                              for key, url in urls.items())
+        return OrderedDict((key, future.result()) for key, future in futures.items())
+
+
+################################
+##          Parsing           ##
+################################
+
+# The chart data is embedded in the page as [new Date("YYYY/MM/DD"),value]
+# records, value being a number or null. The record markers are found in the
+# raw bytes by matching their first byte over the whole page and checking the
+# remaining bytes only at those candidates, and the fixed-width rows after
+# them are gathered by index arithmetic, then decoded as a byte matrix with
+# NumPy: no HTML parsing (so it does not matter which script tag holds the
+# data) and no per-record Python work.
+MARKER = b'[new Date("'
+# Bytes kept after each marker: 'YYYY/MM/DD"),' and a value of up to 27 bytes
+WIDTH = 40
+VALUE_AT = 13
+
+_MARKER_BYTES = np.frombuffer(MARKER, dtype=np.uint8)
+_DIGITS_AT = [0, 1, 2, 3, 5, 6, 8, 9]
+_VALUE_COLUMNS = np.arange(WIDTH - VALUE_AT)
+_NULL = np.frombuffer(b'null', dtype=np.uint8)
+_NAN = np.frombuffer(b'nan ', dtype=np.uint8)
+
+_STOP_BYTES = np.ones(256, dtype=bool)
+_STOP_BYTES[np.frombuffer(b'0123456789.eE+-nul', dtype=np.uint8)] = False
+
+
+def marker_ends(buf):
+    """Positions right after every record marker in a uint8 array."""
+    last = len(buf) - len(MARKER)
+    if last < 0:
+        return np.zeros(0, dtype=np.int64)
+    found = np.flatnonzero(buf[:last + 1] == _MARKER_BYTES[0])
+    for k in range(1, len(MARKER)):
+        found = found[buf[found + k] == _MARKER_BYTES[k]]
+    return found + len(MARKER)
+
+
+def _windows(buf):
+    # Row i is a view of buf[i:i + WIDTH]; indexing it copies just the rows
+    return as_strided(buf, shape=(len(buf) - WIDTH + 1, WIDTH), strides=(1, 1))
+
+
+def record_rows(chunks):
+    """The WIDTH bytes following every record marker, as an (n, WIDTH)
+    uint8 matrix. chunks is the page as bytes or as an iterable of byte
+    chunks (e.g. response.iter_content()); markers and records cut by a
+    chunk boundary are carried over to the next chunk."""
+    if isinstance(chunks, bytes):
+        chunks = [chunks]
+    blocks = []
+    tail = b''
+    for chunk in chunks:
+        buf = np.frombuffer(tail + chunk, dtype=np.uint8)
+        starts = marker_ends(buf)
+        complete = starts[starts + WIDTH <= len(buf)]
+        if len(complete) < len(starts):
+            # Carry the first record the chunk cuts, and everything after it
+            tail = buf[starts[len(complete)] - len(MARKER):].tobytes()
+        else:
+            # Or just enough bytes to complete a cut marker
+            tail = buf[max(0, len(buf) - len(MARKER) + 1):].tobytes()
+        if len(complete):
+            blocks.append(_windows(buf)[complete])
+    if tail.startswith(MARKER):
+        # Records at the very end of the page, padded with zeros
+        buf = np.frombuffer(tail + bytes(WIDTH), dtype=np.uint8)
+        blocks.append(_windows(buf)[marker_ends(buf[:len(tail)])])
+    if not blocks:
+        return np.zeros((0, WIDTH), dtype=np.uint8)
+    return np.concatenate(blocks)
+
+
+def parse_series(chunks):
+    """Dates (datetime64[D]) and values (float64, NaN for null) of a page."""
+    rows = record_rows(chunks)
+    # Wraps around for bytes below '0', so anything but a digit is > 9
+    digits = rows[:, _DIGITS_AT] - np.uint8(ord('0'))
+
+    # The value runs up to its first byte that cannot be part of a number,
+    # which must be the closing bracket; blank out everything from there on.
+    # The last column always counts as a stop, so overlong values fail below
+    text = rows[:, VALUE_AT:].copy()
+    stops = np.take(_STOP_BYTES, text)
+    stops[:, -1] = True
+    end = stops.argmax(axis=1)
+    closed = text[np.arange(len(text)), end] == ord(']')
+    text[_VALUE_COLUMNS >= end[:, None]] = ord(' ')
+
+    # Keep well-formed records only, like the regex used to
+    ok = ((rows[:, 4] == ord('/')) & (rows[:, 7] == ord('/'))
+          & (rows[:, 10] == ord('"')) & (rows[:, 11] == ord(')')) & (rows[:, 12] == ord(','))
+          & (digits <= 9).all(axis=1) & closed & (end > 0))
+    digits, text, end = digits[ok].astype(np.int64), text[ok], end[ok]
+
+    years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    months = digits[:, 4] * 10 + digits[:, 5]
+    days = digits[:, 6] * 10 + digits[:, 7]
+    dates = (((years - 1970) * 12 + months - 1).astype('datetime64[M]').astype('datetime64[D]')
+             + (days - 1).astype('timedelta64[D]'))
+
+    # One strtod pass over all values, separated by spaces
+    nulls = (end == 4) & (text[:, :4] == _NULL).all(axis=1)
+    text[nulls, :4] = _NAN
+    parsed = np.fromstring(text.tobytes(), sep=' ') if len(text) else np.zeros(0)
+    if len(parsed) != len(text):
+        # Something like '1.2.3' split into two numbers; let NumPy complain
+        parsed = text.view('S{}'.format(WIDTH - VALUE_AT)).ravel().astype(np.float64)
+    return dates, parsed
+
+
+def parse_page(page, coin):
+    """Series of one coin's daily values, indexed by date."""
+    dates, values = parse_series(page)
+    return pd.Series(values, index=pd.DatetimeIndex(dates, name='date'), name=coin)
+
+
+################################
+##          Scraping          ##
+################################
+
+def page_urls(tables=None, base_url=BASE_URL):
+    urls = OrderedDict()
+    for table in (tables or PAGES):
+        for coin, path in PAGES[table].items():
+            urls[(table, coin)] = base_url.rstrip('/') + path
+    return urls
+
+
+def save_pages(pages, urls, directory):
+    # Laid out by URL path, so `python -m http.server` in the directory can
+    # stand in for the site
+    for key, page in pages.items():
+        path = os.path.join(directory, unquote(urlsplit(urls[key]).path).lstrip('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(page)
+
+
+def scrape(tables=None, base_url=BASE_URL, workers=WORKERS, save_to=None, **kwargs):
+    """Fetch and parse every page of the given tables ('fees', 'times').
+
+    Returns {table: DataFrame} with one column per coin and the dates as
+    index, like the DataFrames built in the notebook.
+    """
+    urls = page_urls(tables, base_url)
+    pages = fetch_pages(urls, workers, **kwargs)
+    if save_to is not None:
+        save_pages(pages, urls, save_to)
+    frames = OrderedDict()
+    for table in (tables or PAGES):
+        series = [parse_page(pages[(table, coin)], coin) for coin in PAGES[table]]
+        frames[table] = pd.concat(series, axis=1).sort_index()
+    return frames
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape BitInfoCharts and append the new days to the CSVs.')
+    parser.add_argument('tables', nargs='*', metavar='TABLE',
+                        help='tables to refresh: {} (default: all)'.format(', '.join(PAGES)))
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--save-pages', metavar='DIR', help='keep the downloaded pages in DIR')
+    parser.add_argument('--dry-run', action='store_true', help='do not touch the CSVs')
+    args = parser.parse_args()
+    for table in args.tables:
+        if table not in PAGES:
+            parser.error('unknown table {}'.format(table))
+
+    start = time.time()
+    frames = scrape(args.tables or None, args.base_url, args.workers, save_to=args.save_pages)
+    print('Fetched {} pages in {:.2f}s'.format(sum(len(PAGES[t]) for t in frames), time.time() - start))
+    for table, frame in frames.items():
+        if args.dry_run:
+            print('{}: {} days, {} to {}'.format(table, len(frame), frame.index.min(), frame.index.max()))
+        else:
+            print('{}: appended {} days'.format(table, ingest.append_daily(table, frame)))
@@ -0,0 +1,100 @@
+####################################################
+###             DASH SERVING HELPERS             ###
+####################################################
+
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import flask
+import plotly
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings payloads are served in, preferred first
+COMPRESSORS = OrderedDict()
+if brotli is not None:
+    COMPRESSORS['br'] = brotli.compress
+COMPRESSORS['gzip'] = lambda body: gzip.compress(body, 9)
+
+
+def bytes_callback(app, output, inputs=[], state=[]):
+    """Like app.callback, but the decorated function returns the output
+    property already serialized as JSON bytes, which are written straight
+    into the response instead of going through Dash's json.dumps."""
+
+    def wrap_func(func):
+        # Register through Dash so the dependency graph and validation stay
+        # the same, then swap in a handler that skips re-serialization
+        app.callback(output, inputs, state)(func)
+        callback_id = '{}.{}'.format(output.component_id, output.component_property)
+        prefix = '{{"response": {{"props": {{"{}": '.format(output.component_property).encode('utf-8')
+
+        def respond(*args):
+            return flask.Response(prefix + func(*args) + b'}}}',
+                                  mimetype='application/json')
+
+        app.callback_map[callback_id]['callback'] = respond
+        return func
+
+    return wrap_func
+
+
+class PrecompressedPayload(object):
+    """A response body serialized once and kept gzip- and (if the brotli
+    package is installed) brotli-compressed, served with a strong ETag per
+    encoding and 304s for conditional requests. Each encoding is compressed
+    on the first request that asks for it, so building a payload (at boot,
+    for the layout) costs no compression."""
+
+    def __init__(self, body, mimetype='application/json'):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha1(body).hexdigest()
+        # encoding -> (body, etag); the identity body is always available
+        self.encodings = {'identity': (body, self.digest)}
+        self._lock = threading.Lock()
+
+    def _choose(self, request):
+        for encoding in COMPRESSORS:
+            if request.accept_encodings.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+    def encoded(self, encoding):
+        """(body, etag) for encoding, compressing the body if not done yet."""
+        if encoding not in self.encodings:
+            with self._lock:
+                if encoding not in self.encodings:
+                    body = COMPRESSORS[encoding](self.encodings['identity'][0])
+                    self.encodings[encoding] = (body, '{}-{}'.format(self.digest, encoding))
+        return self.encodings[encoding]
+
+    def response(self):
+        request = flask.request
+        encoding = self._choose(request)
+        body, etag = self.encoded(encoding)
+        if request.if_none_match.contains(etag):
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(body, mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Always revalidate; the ETag makes that a bodiless 304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+def precompress_layout(app):
+    """Serialize app.layout once and serve /_dash-layout from the result."""
+    body = json.dumps(app._layout_value(), cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+    payload = PrecompressedPayload(body)
+    endpoint = '{}_dash-layout'.format(app.config['routes_pathname_prefix'])
+    app.server.view_functions[endpoint] = payload.response
+    return payload
@@ -0,0 +1,121 @@
+####################################################
+###        SHARED MEMORY-MAPPED SNAPSHOTS        ###
+####################################################
+
+# Each gunicorn worker used to build the snapshot fields (prefix sums, bucket
+# pyramids, treemap rectangles, market columns) into its own heap, so memory
+# grew by a full copy per worker. Here the fields are built once per bundle
+# version and code version, and saved next to the bundle: every large NumPy
+# array as its own .npy file, and the small object graph around them as a
+# pickle that refers to those files. Arrays that already are memory-mapped
+# bundle columns are referred to where they are instead of copied. Every
+# process then loads the pickle and memory-maps the arrays read-only. Their
+# pages live in the page cache, shared by all workers (and the master under
+# --preload). Refcount updates only
+# touch the small array headers, so the data pages never get copied.
+#
+# The first process to need a version builds it (into a scratch directory,
+# renamed into place); the others load it. SHARED_DATA=0 goes back to
+# building in every process.
+
+import os
+import glob
+import mmap
+import pickle
+import shutil
+import hashlib
+
+import numpy as np
+
+import datastore
+
+ENABLED = os.environ.get('SHARED_DATA', '1') != '0'
+# Arrays smaller than this stay in the pickle
+MIN_BYTES = 4096
+
+
+def code_version(directory=datastore.BASE_DIR):
+    """Digest of the app's modules, so changed builders never load stale fields."""
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        h.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickles large arrays as references to .npy files it writes."""
+
+    def __init__(self, f, directory):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.directory = directory
+        self.saved = {}
+
+    def persistent_id(self, obj):
+        if (not isinstance(obj, np.ndarray) or obj.dtype.hasobject
+                or obj.nbytes < MIN_BYTES):
+            return None
+        if isinstance(obj, np.memmap) and isinstance(obj.base, mmap.mmap) and obj.filename:
+            # A whole .npy file already mapped (e.g. a bundle column): refer
+            # to it instead of writing a second copy. Relative, so the
+            # reference survives moving the tree (e.g. into the Heroku slug)
+            return ('file', os.path.relpath(obj.filename, self.directory))
+        # The same array reached twice is saved once
+        key = id(obj)
+        if key not in self.saved:
+            name = '{:04d}.npy'.format(len(self.saved))
+            np.save(os.path.join(self.directory, name), np.ascontiguousarray(obj))
+            self.saved[key] = (name, obj)
+        return self.saved[key][0]
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+
+    def __init__(self, f, directory):
+        pickle.Unpickler.__init__(self, f)
+        self.directory = directory
+
+    def persistent_load(self, name):
+        if isinstance(name, tuple):
+            name = name[1]
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+
+def save(fields, directory):
+    with open(os.path.join(directory, 'fields.pickle'), 'wb') as f:
+        _ArrayPickler(f, directory).dump(fields)
+
+
+def load(directory):
+    with open(os.path.join(directory, 'fields.pickle'), 'rb') as f:
+        return _ArrayUnpickler(f, directory).load()
+
+
+def shared(build, code=None):
+    """Wrap a build(bundle, previous) -> {field: value} function so its
+    result is built once per bundle and code version and loaded
+    memory-mapped everywhere else."""
+    code = code or code_version()
+
+    def build_shared(bundle, previous=None):
+        target = os.path.join(bundle.path, 'shared', code)
+        if os.path.exists(os.path.join(target, 'fields.pickle')):
+            return load(target)
+        fields = build(bundle, previous)
+        if not os.path.isdir(os.path.dirname(target)):
+            try:
+                os.makedirs(os.path.dirname(target))
+            except OSError:
+                pass
+        with datastore.atomic_directory(target) as tmp:
+            save(fields, tmp)
+        # Fields of older code; processes still using them keep their
+        # mappings after the files are unlinked
+        for name in os.listdir(os.path.dirname(target)):
+            if name != code and not name.startswith('.build-'):
+                shutil.rmtree(os.path.join(os.path.dirname(target), name), ignore_errors=True)
+        # This process maps the files too, instead of keeping its own copy
+        return load(target)
+
+    return build_shared if ENABLED else build
@@ -0,0 +1,103 @@
+####################################################
+###           IMMUTABLE DATA SNAPSHOTS           ###
+####################################################
+
+# Everything the app derives from a data bundle is gathered into one
+# read-only Snapshot. When the CSVs change (see ingest.py), a Reloader
+# running in the background compiles the new bundle and builds the next
+# snapshot off the request path, then replaces its `current` reference in
+# one assignment. Callbacks read `current` once at the start and keep using
+# that snapshot, so a swap never changes data under a request in flight.
+
+import os
+import sys
+import time
+import threading
+import traceback
+
+import datastore
+
+# Seconds between checks for new data; 0 turns the background polling off
+RELOAD_INTERVAL = int(os.environ.get('DATA_RELOAD_INTERVAL', 60))
+
+
+class Snapshot(object):
+    """Read-only set of named fields derived from one bundle version."""
+
+    def __init__(self, bundle, **fields):
+        object.__setattr__(self, 'bundle', bundle)
+        object.__setattr__(self, 'version', bundle.version)
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('snapshots are read-only')
+
+
+class Reloader(object):
+    """Holds the current snapshot and replaces it when the sources change.
+
+    build(bundle, previous) returns a new snapshot; previous is the one it
+    replaces (None at boot), for builders that update state incrementally.
+    Listeners are called with each new snapshot once it is current.
+    """
+
+    def __init__(self, build, src_dir=datastore.BASE_DIR, bundle_dir=datastore.BUNDLE_DIR,
+                 interval=RELOAD_INTERVAL):
+        self.build = build
+        self.src_dir = src_dir
+        self.bundle_dir = bundle_dir
+        self.interval = interval
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stamp = self._source_stamp()
+        self.current = build(datastore.load_bundle(src_dir, bundle_dir), None)
+
+    def _source_stamp(self):
+        # Cheap change detection; the bundle version (a content hash) decides
+        stamp = []
+        for filename in datastore.SOURCES.values():
+            try:
+                st = os.stat(os.path.join(self.src_dir, filename))
+            except OSError:
+                return None
+            stamp.append((st.st_mtime, st.st_size))
+        return tuple(stamp)
+
+    def check(self):
+        """Load and publish a new snapshot if the sources changed. Returns
+        True when a new snapshot was swapped in."""
+        with self._lock:
+            stamp = self._source_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            bundle = datastore.load_bundle(self.src_dir, self.bundle_dir)
+            if bundle.version == self.current.version:
+                self._stamp = stamp
+                return False
+            snapshot = self.build(bundle, self.current)
+            self.current = snapshot
+            # Only now: a failed build is retried on the next check
+            self._stamp = stamp
+            datastore.prune_bundles(bundle.path, self.bundle_dir)
+        for listener in self.listeners:
+            listener(snapshot)
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                # Keep serving the current snapshot; try again next time
+                traceback.print_exc(file=sys.stderr)
+
+    def start(self):
+        """Start polling in a daemon thread (once per process)."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='data-reloader')
+        self._thread.daemon = True
+        self._thread.start()
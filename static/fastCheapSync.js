@@ -0,0 +1,41 @@
+// Keeps the Fast and Cheap date inputs and the graph's time axis in sync in
+// the browser. Zooming fills in the inputs, and picking a date zooms the graph,
+// so every gesture reaches the server as one relayoutData -> figure callback.
+(function () {
+    function setInput(input, value) {
+        if (input.value !== value) {
+            setReactInputValue(input, value);
+        }
+    }
+
+    function bind(graph, start, end) {
+        graph.on('plotly_relayout', function (eventData) {
+            if (eventData['xaxis.autorange']) {
+                setInput(start, start.min);
+                setInput(end, end.max);
+            } else if ('xaxis.range[0]' in eventData) {
+                setInput(start, eventData['xaxis.range[0]'].substring(0, 10));
+                setInput(end, eventData['xaxis.range[1]'].substring(0, 10));
+            }
+        });
+
+        function zoomToInputs() {
+            if (start.value && end.value && start.value <= end.value) {
+                Plotly.relayout(graph, {'xaxis.range': [start.value, end.value]});
+            }
+        }
+        start.addEventListener('change', zoomToInputs);
+        end.addEventListener('change', zoomToInputs);
+    }
+
+    // The graph is only plotted once Dash has rendered the layout
+    var poll = setInterval(function () {
+        var graph = document.getElementById('fastandcheap');
+        var start = document.getElementById('start_date_input');
+        var end = document.getElementById('end_date_input');
+        if (graph && graph.on && start && end) {
+            clearInterval(poll);
+            bind(graph, start, end);
+        }
+    }, 250);
+})();
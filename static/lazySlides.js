@@ -0,0 +1,61 @@
+// Loads the interactive visualizations only when the visitor gets close to
+// their slide. The layout ships placeholder figures; when a slide is due this
+// script either fills in its hidden trigger input (which fires the Dash
+// callback that returns the figure) or, for Fast and Cheap, asks the graph for
+// its full x range, which goes through the usual relayoutData callback.
+(function () {
+    // Slide numbers as used in the navigation bar (#slide=N)
+    var INTERACTIVE = [
+        {slide: 5, trigger: 'load_decentralized'},
+        {slide: 7, trigger: 'load_storevalue'},
+        {slide: 9, graph: 'fastandcheap'}
+    ];
+    // Start loading this many slides ahead of the visualization
+    var APPROACH = 2;
+
+    function load(viz) {
+        if (viz.loaded) {
+            return;
+        }
+        if (viz.trigger) {
+            var input = document.getElementById(viz.trigger);
+            if (!input) {
+                return;
+            }
+            setReactInputValue(input, 'load');
+        } else {
+            var graph = document.getElementById(viz.graph);
+            if (!graph || !graph.on) {
+                return;
+            }
+            Plotly.relayout(graph, {'xaxis.autorange': true});
+        }
+        viz.loaded = true;
+    }
+
+    function onSlide(current) {
+        for (var i = 0; i < INTERACTIVE.length; i++) {
+            var viz = INTERACTIVE[i];
+            if (viz.slide >= current && viz.slide - current <= APPROACH) {
+                load(viz);
+                // Prefetch the next interactive slide as well
+                if (i + 1 < INTERACTIVE.length) {
+                    load(INTERACTIVE[i + 1]);
+                }
+                break;
+            }
+        }
+    }
+
+    var poll = setInterval(function () {
+        var el = document.getElementById('webslides');
+        var graph = document.getElementById('fastandcheap');
+        if (window.ws && el && graph && graph.on) {
+            clearInterval(poll);
+            el.addEventListener('ws:slide-change', function (e) {
+                onSlide(e.detail.currentSlide);
+            });
+            onSlide(window.ws.currentSlideI_ + 1);
+        }
+    }, 250);
+})();
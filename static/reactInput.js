@@ -0,0 +1,13 @@
+// Sets the value of an input rendered by a Dash component from outside of
+// React. Assigning input.value directly would be undone on the next render;
+// going through the native setter and an input event runs the component's
+// onChange, so its state (and the Dash callbacks) follow along. Linked in the
+// page head, ahead of the scripts that use it.
+window.setReactInputValue = (function () {
+    var valueSetter = Object.getOwnPropertyDescriptor(window.HTMLInputElement.prototype, 'value').set;
+
+    return function (input, value) {
+        valueSetter.call(input, value);
+        input.dispatchEvent(new Event('input', {bubbles: true}));
+    };
+})();
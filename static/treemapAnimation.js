@@ -0,0 +1,184 @@
+// Animation mode for the decentralization treemaps. Instead of asking the
+// server for a figure on every slider move, it fetches all snapshots of the
+// current granularity at once (/_treemap-frames/<granularity>.json: shares
+// and rectangles only), turns them into Plotly frames for both graphs and
+// plays or scrubs through them entirely in the browser.
+(function () {
+    var GRAPHS = {count: 'cpm_treemap', values: 'vpm_treemap'};
+    var STEP_MS = 300;
+    var ANIMATION = {mode: 'immediate', frame: {duration: 0, redraw: true}, transition: {duration: 0}};
+
+    var player, toggle, play, scrub, label, sliderBox;
+    var frames = null;
+    var timer = null;
+
+    function buildFrames(payload, dataset) {
+        var names = payload.names;
+        var colors = payload.colors;
+        return payload.rects[dataset].map(function (rects, i) {
+            var shares = payload.values[dataset][i];
+            var x = [], y = [], text = [], shapes = [];
+            for (var j = 0; j < names.length; j++) {
+                var r = rects.slice(4 * j, 4 * j + 4);
+                x.push(r[0] + r[2] / 2);
+                y.push(r[1] + r[3] / 2);
+                text.push(names[j] + '\n' + shares[j].toFixed(2) + '%');
+                shapes.push({type: 'rect', x0: r[0], y0: r[1], x1: r[0] + r[2], y1: r[1] + r[3],
+                             line: {width: 2, color: '#fff'}, fillcolor: colors[j % colors.length]});
+            }
+            return {name: String(i), data: [{x: x, y: y, text: text}], layout: {shapes: shapes}};
+        });
+    }
+
+    function show(i) {
+        scrub.value = i;
+        label.textContent = frames.labels[i];
+        Object.keys(GRAPHS).forEach(function (dataset) {
+            Plotly.animate(document.getElementById(GRAPHS[dataset]), [String(i)], ANIMATION);
+        });
+    }
+
+    function stop() {
+        if (timer !== null) {
+            clearInterval(timer);
+            timer = null;
+        }
+        play.textContent = 'Play';
+    }
+
+    function start() {
+        var i = Number(scrub.value);
+        if (i >= frames.labels.length - 1) {
+            i = -1;
+        }
+        play.textContent = 'Pause';
+        timer = setInterval(function () {
+            i += 1;
+            show(i);
+            if (i >= frames.labels.length - 1) {
+                stop();
+            }
+        }, STEP_MS);
+    }
+
+    function granularity() {
+        var checked = document.querySelector('#treemap_granularity input:checked');
+        return checked ? checked.value : 'month';
+    }
+
+    function sliderPosition(epochs) {
+        // Start where the server-side slider was left
+        var handle = document.querySelector('#date_slider .rc-slider-handle');
+        var value = handle ? Number(handle.getAttribute('aria-valuenow')) : NaN;
+        var best = epochs.length - 1;
+        if (!isNaN(value)) {
+            for (var i = 0; i < epochs.length; i++) {
+                if (Math.abs(epochs[i] - value) < Math.abs(epochs[best] - value)) {
+                    best = i;
+                }
+            }
+        }
+        return best;
+    }
+
+    function enter() {
+        var loaded = Object.keys(GRAPHS).every(function (dataset) {
+            var graph = document.getElementById(GRAPHS[dataset]);
+            return graph.data && graph.data.length;
+        });
+        if (!loaded) {
+            // Still showing the lazy placeholders
+            return;
+        }
+        toggle.disabled = true;
+        fetch('/_treemap-frames/' + granularity() + '.json', {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (payload) {
+                Object.keys(GRAPHS).forEach(function (dataset) {
+                    Plotly.addFrames(document.getElementById(GRAPHS[dataset]), buildFrames(payload, dataset));
+                });
+                frames = payload;
+                scrub.max = payload.labels.length - 1;
+                sliderBox.style.display = 'none';
+                player.style.display = '';
+                toggle.textContent = 'Back to slider';
+                toggle.disabled = false;
+                show(sliderPosition(payload.epochs));
+            })
+            .catch(function () {
+                toggle.disabled = false;
+            });
+    }
+
+    function leave() {
+        stop();
+        // Back on the snapshot the slider (and Dash's figure) still points at
+        show(sliderPosition(frames.epochs));
+        frames = null;
+        player.style.display = 'none';
+        sliderBox.style.display = '';
+        toggle.textContent = 'Animate in browser';
+    }
+
+    function bind(container) {
+        sliderBox = document.getElementById('date_slider_container');
+
+        toggle = document.createElement('button');
+        toggle.textContent = 'Animate in browser';
+        toggle.addEventListener('click', function () {
+            if (frames) {
+                leave();
+            } else {
+                enter();
+            }
+        });
+
+        player = document.createElement('div');
+        player.style.display = 'none';
+        play = document.createElement('button');
+        play.textContent = 'Play';
+        play.addEventListener('click', function () {
+            if (timer !== null) {
+                stop();
+            } else {
+                start();
+            }
+        });
+        scrub = document.createElement('input');
+        scrub.type = 'range';
+        scrub.min = 0;
+        scrub.step = 1;
+        scrub.style.width = '60%';
+        scrub.addEventListener('input', function () {
+            stop();
+            show(Number(scrub.value));
+        });
+        label = document.createElement('span');
+        player.appendChild(play);
+        player.appendChild(scrub);
+        player.appendChild(label);
+
+        container.appendChild(player);
+        container.appendChild(toggle);
+
+        // The frames belong to one granularity; switching goes back to the slider
+        document.getElementById('treemap_granularity').addEventListener('change', function () {
+            if (frames) {
+                leave();
+            }
+        });
+    }
+
+    var poll = setInterval(function () {
+        var container = document.getElementById('treemap_player');
+        var ready = container && document.getElementById('treemap_granularity') &&
+            Object.keys(GRAPHS).every(function (dataset) {
+                var graph = document.getElementById(GRAPHS[dataset]);
+                return graph && graph.on;
+            });
+        if (ready) {
+            clearInterval(poll);
+            bind(container);
+        }
+    }, 250);
+})();
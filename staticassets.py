@@ -0,0 +1,315 @@
+####################################################
+###           FINGERPRINTED STATIC ASSETS        ###
+####################################################
+
+# The slides pull large images, scripts and stylesheets from static/ and
+# assets/. This build step copies every file under a name that carries a
+# hash of its contents and writes a manifest, so the app can link the
+# fingerprinted URLs and serve them as immutable for a year: a repeat visit
+# downloads nothing, and a changed file gets a new URL.
+#
+# Text files (scripts, stylesheets, SVGs) are also stored gzip- and brotli-
+# compressed. With Pillow installed, raster images get a WebP version (served
+# to browsers that accept it, when it is smaller) and narrower copies for
+# srcset. Both are optional: without brotli or Pillow the build just skips
+# those variants.
+#
+#     python staticassets.py
+#
+# Only new or changed files are processed. If the build is missing or stale,
+# load() runs it at boot, so a fresh checkout still serves every file.
+
+import os
+import io
+import gzip
+import json
+import hashlib
+import mimetypes
+from collections import OrderedDict
+
+import flask
+
+import datastore
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# URL prefix -> source directory
+SOURCES = OrderedDict([('/static', 'static'), ('/assets', 'assets')])
+BUILD_DIR = os.path.join(datastore.BASE_DIR, '.static-build')
+URL_PREFIX = '/_assets'
+# Bump whenever the build output changes for the same sources
+FORMAT_VERSION = 1
+
+TEXT_TYPES = ('.js', '.css', '.svg', '.json', '.html', '.txt')
+RASTER_TYPES = ('.png', '.jpg', '.jpeg', '.gif')
+# Narrower copies of raster images wider than these, for srcset
+WIDTHS = (480, 960, 1600)
+WEBP_QUALITY = 80
+MAX_AGE = 365 * 24 * 3600
+
+MIMETYPES = {'.webp': 'image/webp', '.svg': 'image/svg+xml', '.js': 'application/javascript'}
+
+
+def mimetype(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return MIMETYPES.get(ext) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+################################
+##           Build            ##
+################################
+
+def _write(path, data):
+    with datastore.atomic_write(path, 0o644) as f:
+        f.write(data)
+
+
+def _encode_image(image, fmt, **options):
+    out = io.BytesIO()
+    image.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def _save_options(ext):
+    if ext in ('.jpg', '.jpeg'):
+        return 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}
+    if ext == '.png':
+        return 'PNG', {'optimize': True}
+    return None, {}
+
+
+def _image_variants(data, ext):
+    """{'width': pixels, 'webp': bytes or None,
+    'widths': {width: (bytes, webp bytes or None)}}"""
+    image = Image.open(io.BytesIO(data))
+    variants = {'width': image.width, 'webp': None, 'widths': OrderedDict()}
+    animated = getattr(image, 'is_animated', False)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    def webp(img, original):
+        encoded = _encode_image(img, 'WEBP', quality=WEBP_QUALITY)
+        return encoded if len(encoded) < len(original) else None
+
+    if animated:
+        # Animated GIFs: one animated WebP at full size, no resizing
+        encoded = _encode_image(Image.open(io.BytesIO(data)), 'WEBP', save_all=True,
+                                quality=WEBP_QUALITY)
+        variants['webp'] = encoded if len(encoded) < len(data) else None
+        return variants
+    variants['webp'] = webp(image, data)
+    fmt, options = _save_options(ext)
+    if fmt is None:
+        return variants
+    for width in WIDTHS:
+        if width >= image.width:
+            break
+        height = max(1, int(round(image.height * width / float(image.width))))
+        resized = image.resize((width, height), Image.LANCZOS)
+        if fmt == 'JPEG' and resized.mode == 'RGBA':
+            resized = resized.convert('RGB')
+        encoded = _encode_image(resized, fmt, **options)
+        variants['widths'][width] = (encoded, webp(resized, encoded))
+    return variants
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime, st.st_size]
+
+
+def _source_files(src_dir):
+    for prefix, directory in SOURCES.items():
+        root = os.path.join(src_dir, directory)
+        for current, _, files in os.walk(root):
+            for name in sorted(files):
+                path = os.path.join(current, name)
+                yield prefix + '/' + os.path.relpath(path, root).replace(os.sep, '/'), path
+
+
+def _build_file(path, build_dir):
+    with open(path, 'rb') as f:
+        data = f.read()
+    stem, ext = os.path.splitext(os.path.basename(path))
+    ext = ext.lower()
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    name = '{}.{}{}'.format(stem, digest, ext)
+    entry = {'file': name, 'digest': digest, 'bytes': len(data), 'encodings': [],
+             'webp': False, 'widths': OrderedDict()}
+
+    def store(filename, body):
+        _write(os.path.join(build_dir, filename), body)
+
+    store(name, data)
+    if ext in TEXT_TYPES:
+        compressed = OrderedDict([('gzip', gzip.compress(data, 9))])
+        if brotli is not None:
+            compressed['br'] = brotli.compress(data)
+        for encoding, body in compressed.items():
+            if len(body) < len(data):
+                store('{}.{}'.format(name, encoding), body)
+                entry['encodings'].append(encoding)
+    elif ext in RASTER_TYPES and Image is not None:
+        variants = _image_variants(data, ext)
+        entry['width'] = variants['width']
+        if variants['webp'] is not None:
+            store(name + '.webp', variants['webp'])
+            entry['webp'] = True
+        for width, (body, webp) in variants['widths'].items():
+            resized = '{}.{}.{}w{}'.format(stem, digest, width, ext)
+            store(resized, body)
+            if webp is not None:
+                store(resized + '.webp', webp)
+            entry['widths'][str(width)] = {'file': resized, 'webp': webp is not None}
+    return entry
+
+
+def _read_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, 'manifest.json')) as f:
+            manifest = json.load(f, object_pairs_hook=OrderedDict)
+    except (IOError, OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def _variants_key():
+    # What the optional packages allow; installing one rebuilds
+    return {'brotli': brotli is not None, 'images': Image is not None}
+
+
+def is_stale(manifest, src_dir=datastore.BASE_DIR):
+    if manifest is None or manifest['variants'] != _variants_key():
+        return True
+    files = manifest['files']
+    sources = dict(_source_files(src_dir))
+    if set(sources) != set(files):
+        return True
+    return any(files[url]['stamp'] != _stamp(path) for url, path in sources.items())
+
+
+def build(src_dir=datastore.BASE_DIR, build_dir=BUILD_DIR):
+    """Fingerprint, compress and resize every file that changed since the
+    last build, and return the new manifest. Files of earlier builds are
+    kept, so pages still holding their URLs keep working."""
+    if not os.path.isdir(build_dir):
+        os.makedirs(build_dir)
+    previous = _read_manifest(build_dir)
+    reuse = previous is not None and previous['variants'] == _variants_key()
+    files = OrderedDict()
+    for url, path in _source_files(src_dir):
+        stamp = _stamp(path)
+        old = previous['files'].get(url) if reuse else None
+        if old is not None and old['stamp'] == stamp and os.path.exists(os.path.join(build_dir, old['file'])):
+            files[url] = old
+            continue
+        entry = _build_file(path, build_dir)
+        entry['stamp'] = stamp
+        files[url] = entry
+    manifest = OrderedDict([('format', FORMAT_VERSION), ('variants', _variants_key()), ('files', files)])
+    _write(os.path.join(build_dir, 'manifest.json'), json.dumps(manifest, indent=1).encode('utf-8'))
+    return manifest
+
+
+################################
+##          Serving           ##
+################################
+
+class AssetManifest(object):
+    """Maps source URLs (/static/x.png) to fingerprinted ones and serves
+    the build directory."""
+
+    def __init__(self, manifest, build_dir=BUILD_DIR, prefix=URL_PREFIX):
+        self.build_dir = build_dir
+        self.prefix = prefix
+        self.files = manifest['files'] if manifest else {}
+        self.version = hashlib.sha1(''.join(sorted(e['digest'] for e in self.files.values()))
+                                    .encode('utf-8')).hexdigest()[:12]
+        # Served file name -> (entry, whether a .webp twin exists)
+        self.served = {}
+        for entry in self.files.values():
+            self.served[entry['file']] = (entry, entry['webp'])
+            for resized in entry['widths'].values():
+                self.served[resized['file']] = (entry, resized['webp'])
+
+    def url(self, path):
+        """Fingerprinted URL of a /static or /assets path; the path itself
+        when it is not in the build (e.g. a missing file)."""
+        entry = self.files.get(path)
+        return path if entry is None else '{}/{}'.format(self.prefix, entry['file'])
+
+    def srcset(self, path):
+        """srcset listing the narrower copies and the original, or None."""
+        entry = self.files.get(path)
+        if not entry or not entry['widths']:
+            return None
+        candidates = ['{}/{} {}w'.format(self.prefix, resized['file'], width)
+                      for width, resized in entry['widths'].items()]
+        return ', '.join(candidates + [self.url(path) + ' {}w'.format(entry['width'])])
+
+    def response(self, filename):
+        if filename not in self.served:
+            flask.abort(404)
+        entry, has_webp = self.served[filename]
+        request = flask.request
+        path = os.path.join(self.build_dir, filename)
+        vary = []
+        headers = {}
+        content_type = mimetype(filename)
+        if has_webp:
+            vary.append('Accept')
+            if 'image/webp' in request.headers.get('Accept', ''):
+                path, content_type = path + '.webp', 'image/webp'
+        if entry['encodings']:
+            vary.append('Accept-Encoding')
+            for encoding in ('br', 'gzip'):
+                if encoding in entry['encodings'] and request.accept_encodings.quality(encoding) > 0:
+                    path = '{}.{}'.format(path, encoding)
+                    headers['Content-Encoding'] = encoding
+                    break
+        # Streamed from disk, with ETag, If-None-Match and Range handling
+        try:
+            response = flask.send_file(path, mimetype=content_type, conditional=True)
+        except (IOError, OSError):
+            flask.abort(404)
+        response.headers.update(headers)
+        if vary:
+            response.headers['Vary'] = ', '.join(vary)
+        # The name changes with the contents, so it never needs revalidating
+        response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(MAX_AGE)
+        return response
+
+    def serve(self, server):
+        server.add_url_rule(self.prefix + '/<path:filename>', 'fingerprinted_asset', self.response)
+
+
+def load(src_dir=datastore.BASE_DIR, build_dir=BUILD_DIR):
+    """AssetManifest of the current build, building it first if stale."""
+    manifest = _read_manifest(build_dir)
+    if is_stale(manifest, src_dir):
+        try:
+            manifest = build(src_dir, build_dir)
+        except (IOError, OSError):
+            # Read-only checkout: serve the plain files instead
+            manifest = None
+    return AssetManifest(manifest, build_dir)
+
+
+if __name__ == '__main__':
+    manifest = build()
+    total = sum(entry['bytes'] for entry in manifest['files'].values())
+    print('{} files ({:,} bytes) fingerprinted into {}'.format(len(manifest['files']), total, BUILD_DIR))
+    if brotli is None:
+        print('brotli not installed: text assets are gzip-compressed only')
+    if Image is None:
+        print('Pillow not installed: no WebP or resized images')
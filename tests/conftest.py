@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import datastore
+from markets import MarketStore
+
+
+@pytest.fixture(scope='session')
+def bundle(tmp_path_factory):
+    # Compiled from the repo's CSVs into a scratch directory, leaving .bundle/ alone
+    return datastore.load_bundle(ROOT, str(tmp_path_factory.mktemp('bundle')))
+
+
+@pytest.fixture(scope='session')
+def market_store(bundle):
+    return MarketStore.from_bundle(bundle)
@@ -0,0 +1,63 @@
+import copy
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import VolatilityStats
+from markets import MarketStore
+
+
+def store_until(bundle, day):
+    columns = bundle.columns('markets')
+    keep = columns['date'] <= pd.Timestamp(day).value // 10**9
+    return MarketStore(OrderedDict((k, np.asarray(v)[keep]) for k, v in columns.items()),
+                       bundle.categories('markets', 'name'))
+
+
+def assert_close(got, expected, path='summary'):
+    # Equal up to float rounding: running sums restarted at other rows differ
+    # in the last bits. Coins first seen by a later update come last, so key
+    # order is not compared
+    if isinstance(expected, dict):
+        assert sorted(got) == sorted(expected), path
+        for key in expected:
+            assert_close(got[key], expected[key], '{}[{!r}]'.format(path, key))
+    elif isinstance(expected, float):
+        assert got == pytest.approx(expected, rel=1e-9), path
+    else:
+        assert got == expected, path
+
+
+def test_incremental_update_matches_full(bundle, market_store):
+    full = VolatilityStats().update(market_store).summary()
+    stats = VolatilityStats().update(store_until(bundle, '2016-06-30'))
+    # As the reloader does: copy the previous stats and fold in the new rows
+    stats = copy.deepcopy(stats).update(store_until(bundle, '2017-12-31'))
+    stats.update(market_store)
+    assert_close(stats.summary(), full)
+
+
+def test_summary_matches_pandas(bundle, market_store):
+    summary = VolatilityStats().update(market_store).summary()
+    df = bundle.frame('markets')
+    for name, coin in df.groupby('name'):
+        if not len(coin):
+            continue
+        coin = coin.sort_values('date').set_index('date')
+        stats = summary['coins'][name]
+        change = coin['change%'].astype(np.float64)
+        assert stats['max_up']['value'] == pytest.approx(change.max())
+        assert stats['max_up']['date'] == str(change.idxmax().date())
+        assert stats['max_down']['value'] == pytest.approx(change.min())
+        close = coin['close'].astype(np.float64)
+        drawdown = 1.0 - close / close.cummax()
+        assert stats['max_drawdown']['value'] == pytest.approx(drawdown.max(), rel=1e-6)
+        for window, volatility in stats['volatility'].items():
+            rolling = change.rolling(int(window)).std()
+            if rolling.notnull().any():
+                assert volatility['max']['value'] == pytest.approx(rolling.max(), rel=1e-6)
+                assert volatility['max']['date'] == str(rolling.idxmax().date())
+            else:
+                assert volatility['max']['value'] is None
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from correlation import RollingCorrelation, MIN_PERIODS
+
+WINDOWS = [(None, None), ('2017-01-01', '2017-12-31'), ('2018-03-05', '2018-04-01'),
+           ('2016-02-03', '2016-02-05'), ('2014-01-01', '2018-01-09')]
+
+
+def returns_frame(correlations):
+    values = np.where(correlations.v > 0, correlations.x, np.nan)
+    return pd.DataFrame(values, index=pd.to_datetime(correlations.index.epochs, unit='s'),
+                        columns=correlations.names)
+
+
+# The default budget keeps the sums of every day; the small ones force
+# strides, so windows also fold in rows between kept sums
+@pytest.mark.parametrize('max_bytes', [None, 200000, 20000])
+def test_window_matrix_matches_pandas(market_store, max_bytes):
+    if max_bytes is None:
+        correlations = RollingCorrelation.from_store(market_store)
+    else:
+        correlations = RollingCorrelation.from_store(market_store, max_bytes=max_bytes)
+        assert correlations.stride > 1
+    df = returns_frame(correlations)
+    for start, end in WINDOWS:
+        expected = df.loc[start:end].corr(min_periods=MIN_PERIODS).values
+        got = correlations.matrix(start, end)
+        assert np.array_equal(np.isnan(got), np.isnan(expected)), (start, end)
+        assert np.allclose(got, expected, rtol=0, atol=1e-10, equal_nan=True), (start, end)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from rangestats import RangeMeans
+from timeindex import TimeIndex
+
+WINDOWS = [(None, None), ('2017-01-01', '2017-12-31'), ('2018-02-03', '2018-02-03'),
+           ('2014-06-01', '2016-01-15'), ('2030-01-01', None)]
+
+
+@pytest.mark.parametrize('table', ['fees', 'times'])
+def test_window_means_match_pandas(bundle, table):
+    df = bundle.frame(table)
+    names = [c for c in df.columns if c != 'date']
+    means = RangeMeans.from_frame(TimeIndex.from_datetimes(df['date']), df, names)
+    indexed = df.set_index('date')[names].astype(np.float64)
+    for start, end in WINDOWS:
+        expected = indexed.loc[start:end].mean()
+        got = means.means(start, end)
+        for name in names:
+            if np.isnan(expected[name]):
+                assert np.isnan(got[name]), (table, name, start, end)
+            else:
+                assert got[name] == pytest.approx(expected[name], rel=1e-9), (table, name, start, end)
@@ -0,0 +1,105 @@
+import threading
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import scraper
+
+FLAKY = ('fees', 'eth')
+
+
+def page(values):
+    # A chart page as BitInfoCharts serves it: records inside a script tag
+    records = ','.join('[new Date("{}"),{}]'.format(day.strftime('%Y/%m/%d'), value)
+                       for day, value in values.items())
+    return '<html><script>var data = [{}];</script></html>'.format(records).encode()
+
+
+def expected_values():
+    days = pd.date_range('2018-01-01', periods=5)
+    values = {}
+    for n, key in enumerate(scraper.page_urls()):
+        series = pd.Series(np.arange(5) * 1.5 + n, index=days)
+        series.iloc[n % 5] = np.nan
+        values[key] = series
+    return values
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture(scope='module')
+def site():
+    values = expected_values()
+    paths = {unquote(scraper.PAGES[table][coin]): page(series.fillna('null'))
+             for (table, coin), series in values.items()}
+    flaky_path = unquote(scraper.PAGES[FLAKY[0]][FLAKY[1]])
+    hits = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            path = unquote(self.path)
+            with lock:
+                hits[path] = hits.get(path, 0) + 1
+                first = hits[path] == 1
+            if path not in paths:
+                self.send_error(404)
+            elif path == flaky_path and first:
+                self.send_error(503)
+            else:
+                body = paths[path]
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), values, hits, flaky_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_retries_unavailable_page(site):
+    base_url, values, hits, flaky_path = site
+    hits.clear()
+    session = scraper.make_session(retries=2, backoff=0)
+    url = scraper.page_urls(base_url=base_url)[FLAKY]
+    assert scraper.fetch(session, scraper.HostRateLimiter(0), url) == page(values[FLAKY].fillna('null'))
+    assert hits[flaky_path] == 2
+
+
+def test_fetch_pages_keeps_key_order(site):
+    base_url = site[0]
+    urls = scraper.page_urls(base_url=base_url)
+    keys = list(reversed(urls))
+    pages = scraper.fetch_pages(scraper.OrderedDict((key, urls[key]) for key in keys),
+                                session=scraper.make_session(retries=2, backoff=0),
+                                limiter=scraper.HostRateLimiter(0))
+    assert list(pages) == keys
+
+
+def test_scrape_returns_frames_per_table(site):
+    base_url, values = site[:2]
+    frames = scraper.scrape(base_url=base_url, session=scraper.make_session(retries=2, backoff=0),
+                            limiter=scraper.HostRateLimiter(0))
+    assert list(frames) == list(scraper.PAGES)
+    for table, frame in frames.items():
+        assert list(frame.columns) == list(scraper.PAGES[table])
+        for coin in frame.columns:
+            expected = values[(table, coin)]
+            assert list(frame.index) == list(expected.index)
+            assert np.array_equal(np.isnan(frame[coin].values), np.isnan(expected.values))
+            assert np.allclose(frame[coin].dropna().values, expected.dropna().values)
@@ -0,0 +1,68 @@
+####################################################
+###              EPOCH TIME INDEX                ###
+####################################################
+
+# Sorted int64 epoch-second arrays built once per table. Snapshot and range
+# lookups are a searchsorted away, so callbacks never convert a whole pandas
+# index per request.
+
+import numbers
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+
+def epoch_seconds(value):
+    """Epoch seconds for a number, date/datetime, Timestamp or date string."""
+    if isinstance(value, numbers.Number):
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return pd.Timestamp(value).value // 10**9
+
+
+class TimeIndex(object):
+
+    def __init__(self, epochs):
+        self.epochs = np.asarray(epochs, dtype=np.int64)
+
+    @classmethod
+    def from_datetimes(cls, values):
+        values = pd.to_datetime(values)
+        if isinstance(values, pd.Series):
+            values = values.values
+        return cls(np.asarray(values, dtype='datetime64[s]').astype(np.int64))
+
+    def __len__(self):
+        return len(self.epochs)
+
+    @property
+    def first(self):
+        return int(self.epochs[0])
+
+    @property
+    def last(self):
+        return int(self.epochs[-1])
+
+    def nearest_pos(self, ts):
+        """Position of the entry closest to ts; ties go to the earlier one."""
+        t = epoch_seconds(ts)
+        pos = int(np.searchsorted(self.epochs, t, side='left'))
+        if pos == 0:
+            return 0
+        if pos == len(self.epochs):
+            return pos - 1
+        if self.epochs[pos] - t < t - self.epochs[pos - 1]:
+            return pos
+        return pos - 1
+
+    def nearest(self, ts):
+        """Epoch of the entry closest to ts."""
+        return int(self.epochs[self.nearest_pos(ts)])
+
+    def range(self, start=None, end=None):
+        """(lo, hi) positions of the entries with start <= t <= end, for slicing."""
+        lo = 0 if start is None else int(np.searchsorted(self.epochs, epoch_seconds(start), side='left'))
+        hi = len(self.epochs) if end is None else int(np.searchsorted(self.epochs, epoch_seconds(end), side='right'))
+        return lo, max(lo, hi)
@@ -0,0 +1,70 @@
+####################################################
+###            PRECOMPUTED TREEMAP LAYOUTS       ###
+####################################################
+
+# The decentralization treemaps show, for each snapshot (a month or a week),
+# the share of each of the six balance bins. The shares are already
+# normalized to percentages in the bundle; this keeps them as one
+# (snapshots x bins) matrix per table and squarifies every row once, so
+# moving the slider only looks rectangles up no matter how fine the
+# snapshots are.
+
+import threading
+
+import numpy as np
+import squarify
+
+from timeindex import TimeIndex
+
+# Added to every share so empty bins still get a (zero-width) rectangle
+EPSILON = 0.0000001
+
+
+class TreemapLayouts(object):
+
+    def __init__(self, index, values, names, x=0, y=0, width=100, height=100):
+        # index: TimeIndex of the snapshots; values: (snapshots, bins) shares
+        self.index = index
+        self.values = np.asarray(values, dtype=np.float64)
+        self.names = list(names)
+        self.box = (x, y, width, height)
+        self._rects = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bundle(cls, bundle, table, names, date_column='Month', **box):
+        columns = bundle.columns(table)
+        values = np.column_stack([columns[name] for name in names])
+        return cls(TimeIndex(columns[date_column]), values, names, **box)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def rects(self):
+        """(snapshots, bins, 4) array of x, y, dx, dy, built on first use."""
+        if self._rects is None:
+            with self._lock:
+                if self._rects is None:
+                    x, y, width, height = self.box
+                    rects = np.empty(self.values.shape + (4,))
+                    for i, row in enumerate(self.values):
+                        normed = squarify.normalize_sizes(list(row + EPSILON), width, height)
+                        for j, r in enumerate(squarify.squarify(normed, x, y, width, height)):
+                            rects[i, j] = r['x'], r['y'], r['dx'], r['dy']
+                    self._rects = rects
+        return self._rects
+
+    def __getstate__(self):
+        # Pickled with the rectangles built, so loading never squarifies
+        state = dict(self.__dict__, _rects=self.rects)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def snapshot(self, pos):
+        """(shares, rects) of the snapshot at position pos."""
+        return self.values[pos], self.rects[pos]
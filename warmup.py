@@ -0,0 +1,89 @@
+####################################################
+###             FIGURE CACHE WARM-UP             ###
+####################################################
+
+# From a worker's first request on, and again after every data reload, a
+# background thread builds the figures visitors ask for first so they are
+# cache hits by the time anyone asks. Nothing waits for it: the worker serves from the start,
+# and a figure that is not warm yet is built on demand as before. Figures
+# already in the shared disk cache (e.g. warmed by another worker) cost a
+# file read.
+
+import os
+import sys
+import time
+import threading
+import traceback
+
+# CACHE_WARMUP=0 turns warm-up off
+ENABLED = os.environ.get('CACHE_WARMUP', '1') != '0'
+# Seconds between two figures, so warm-up does not starve requests of the GIL
+PAUSE = float(os.environ.get('CACHE_WARMUP_PAUSE', 0.01))
+
+
+class CacheWarmer(object):
+    """Runs the tasks for the latest snapshot in a daemon thread.
+
+    tasks(snapshot) returns callables that each build (and so cache) one
+    figure, most wanted first. A newer snapshot interrupts the current run.
+    """
+
+    def __init__(self, tasks, pause=PAUSE, enabled=ENABLED):
+        self.tasks = tasks
+        self.pause = pause
+        self.enabled = enabled
+        # Progress of the current run
+        self.version = None
+        self.done = 0
+        self.total = 0
+        self._pending = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, snapshot):
+        """Warm snapshot unless this process already has a warm-up thread.
+        Threads do not survive a fork, so calling this again in a forked
+        worker starts one there."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+        self.warm(snapshot)
+
+    def warm(self, snapshot):
+        """Warm snapshot, dropping whatever run is in progress."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._pending = snapshot
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                thread = threading.Thread(target=self._run, name='cache-warmup')
+                thread.daemon = True
+                thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                self._wake.clear()
+            if snapshot is None:
+                continue
+            try:
+                tasks = list(self.tasks(snapshot))
+            except Exception:
+                # Keep the thread alive for the next reload
+                traceback.print_exc(file=sys.stderr)
+                continue
+            self.version, self.done, self.total = snapshot.version, 0, len(tasks)
+            for task in tasks:
+                if self._pending is not None:
+                    break
+                try:
+                    task()
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+                self.done += 1
+                time.sleep(self.pause)